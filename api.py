@@ -0,0 +1,270 @@
+"""
+Headless HTTP API for lesson customization, for LMS integrations and load tests.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+    python api.py
+
+POST /v1/customize with a JSON body:
+
+    {"resource_id": "26646", "benchmark_code": "MA.K.NSO.1.1", "benchmark_id": "15232",
+     "query": "...", "history": [{"query", "resource_id", "benchmark", "ai_output"}, ...],
+     "format": "json" | "docx" | "pdf", "stream": false}
+
+"format" returns the result as JSON or the combined lesson as a file. With "stream": true
+the response is NDJSON instead: a "context" line, "delta" lines while the model writes and
+a final "result" line (or an "error" line). GET /v1/artifacts/{id} serves generated
+worksheets; set ARTIFACT_DIR so every worker process can see them. GET /healthz.
+
+Each request runs the blocking pipeline on its own thread from a bounded pool, so one
+worker process serves up to API_MAX_CONCURRENCY requests at once. Requests that cannot get
+a slot within API_QUEUE_TIMEOUT are refused with 503.
+"""
+import os
+import json
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from service import (
+    prepare_request, customize_events, export_customization, LessonRequestError,
+    CustomizationResult, HISTORY_LIMIT,
+)
+from exports import export_service, ExportQueueFull, EXPORT_FORMATS
+from artifactstore import artifact_store, is_artifact_id
+
+load_dotenv()
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "16"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "10"))
+API_MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", str(1024 * 1024)))
+
+_executor = ThreadPoolExecutor(max_workers=API_MAX_CONCURRENCY, thread_name_prefix="api")
+_slots = None
+_DONE = object()
+
+
+async def _send(send, status: int, body: bytes, content_type: str, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+                   + [(k.encode(), v.encode()) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status: int, payload: dict):
+    await _send(send, status, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), "application/json")
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > API_MAX_BODY_BYTES:
+            raise LessonRequestError("❌ Request body is too large.", status=413)
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _history(raw) -> list:
+    if not isinstance(raw, list):
+        return []
+    entries = []
+    for entry in raw[-HISTORY_LIMIT:]:
+        if isinstance(entry, dict):
+            entries.append({k: str(entry.get(k) or "") for k in ("query", "resource_id", "benchmark", "ai_output")})
+    return entries
+
+
+def _run_pipeline(loop, events_queue, cancelled, request, history, model_stream, dedup_key):
+    """Drive customize_events on this worker thread and hand each event to the event loop"""
+    def put(item):
+        loop.call_soon_threadsafe(events_queue.put_nowait, item)
+
+    events = customize_events(request, history=history, stream=model_stream, dedup_key=dedup_key)
+    try:
+        for event in events:
+            put(event)
+            if cancelled.is_set():
+                break
+    except LessonRequestError as e:
+        put({"event": "error", "status": e.status, "error": str(e)})
+    except Exception as e:
+        print(f"❌ Customization failed: {e}")
+        put({"event": "error", "status": 500, "error": "❌ The lesson could not be generated. Please try again."})
+    finally:
+        events.close()
+        put(_DONE)
+
+
+async def _events(payload: dict, model_stream: bool, cancelled: threading.Event):
+    request = prepare_request(
+        str(payload.get("resource_id") or ""),
+        str(payload.get("benchmark_code") or ""),
+        str(payload.get("benchmark_id") or ""),
+        str(payload.get("query") or ""),
+    )
+    loop = asyncio.get_running_loop()
+    events_queue = asyncio.Queue()
+    # A fresh context per request so the pipeline's trace never leaks between requests.
+    context = contextvars.Context()
+    loop.run_in_executor(
+        _executor, context.run, _run_pipeline, loop, events_queue, cancelled, request,
+        _history(payload.get("history")), model_stream, payload.get("dedup_key")
+    )
+    while True:
+        event = await events_queue.get()
+        if event is _DONE:
+            return
+        yield event
+
+
+async def _watch_disconnect(receive, cancelled: threading.Event):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            cancelled.set()
+            return
+
+
+async def _stream_customization(payload: dict, receive, send):
+    cancelled = threading.Event()
+    events = _events(payload, bool(payload.get("model_stream", True)), cancelled)
+    first = await events.__anext__()
+    if first["event"] == "error":
+        await _send_json(send, first["status"], {"error": first["error"]})
+        return
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, cancelled))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson"), (b"cache-control", b"no-cache")],
+        })
+        await send({"type": "http.response.body", "body": (json.dumps(first, ensure_ascii=False) + "\n").encode("utf-8"), "more_body": True})
+        async for event in events:
+            if cancelled.is_set():
+                continue  # drain so the worker thread can finish and free its slot
+            line = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            await send({"type": "http.response.body", "body": line, "more_body": True})
+        if not cancelled.is_set():
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        watcher.cancel()
+
+
+async def _customize(payload: dict, send):
+    fmt = str(payload.get("format") or "json").lower()
+    if fmt != "json" and fmt not in EXPORT_FORMATS:
+        raise LessonRequestError(f"❌ Unknown format '{fmt}'. Use json, {', '.join(EXPORT_FORMATS)}.")
+    result = None
+    async for event in _events(payload, False, threading.Event()):
+        if event["event"] == "error":
+            await _send_json(send, event["status"], {"error": event["error"]})
+            return
+        if event["event"] == "result":
+            result = CustomizationResult(**{k: v for k, v in event.items() if k != "event"})
+    if result is None:
+        await _send_json(send, 500, {"error": "❌ The lesson could not be generated. Please try again."})
+        return
+    if fmt == "json":
+        await _send_json(send, 200, result.to_dict())
+        return
+
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(_executor, export_customization, result.lesson_plan, result.ai_output, fmt)
+    filename = f"cpalms_combined_{result.resource_id}.{EXPORT_FORMATS[fmt]['extension']}"
+    await _send(send, 200, data, EXPORT_FORMATS[fmt]["mime"], [
+        ("content-disposition", f'attachment; filename="{filename}"'),
+        ("x-trace-id", result.trace_id),
+    ])
+
+
+async def _artifact(artifact_id: str, send):
+    artifact = artifact_store.get(artifact_id) if is_artifact_id(artifact_id) else None
+    if artifact is None:
+        await _send_json(send, 404, {"error": "⚠️ This file is no longer available. Please run the request again."})
+        return
+    await _send(send, 200, artifact.data, artifact.mime, [
+        ("content-disposition", f'attachment; filename="{artifact.filename}"'),
+        ("x-filename", artifact.filename),
+    ])
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _executor.shutdown(wait=False)
+            export_service.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    global _slots
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"].rstrip("/") or "/"
+    if method == "GET" and path == "/healthz":
+        await _send_json(send, 200, {"status": "ok"})
+        return
+    if method == "GET" and path.startswith("/v1/artifacts/"):
+        await _artifact(path[len("/v1/artifacts/"):], send)
+        return
+    if path != "/v1/customize":
+        await _send_json(send, 404, {"error": "Not found"})
+        return
+    if method != "POST":
+        await _send_json(send, 405, {"error": "Use POST"})
+        return
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=API_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        await _send_json(send, 503, {"error": "⚠️ The lesson service is busy. Please try again in a moment."})
+        return
+    try:
+        body = await _read_body(receive)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise LessonRequestError("❌ The request body is not valid JSON.")
+        if not isinstance(payload, dict):
+            raise LessonRequestError("❌ The request body must be a JSON object.")
+        if payload.get("stream"):
+            await _stream_customization(payload, receive, send)
+        else:
+            await _customize(payload, send)
+    except LessonRequestError as e:
+        await _send_json(send, e.status, {"error": str(e)})
+    except ExportQueueFull:
+        await _send_json(send, 429, {"error": "⚠️ Many downloads are being prepared right now. Please try again in a moment."})
+    except ConnectionError:
+        pass
+    finally:
+        _slots.release()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
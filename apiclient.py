@@ -0,0 +1,81 @@
+"""
+Client for the customization API (api.py), so the Streamlit app can hand the pipeline to a
+separately scaled pool of API workers by setting CUSTOMIZER_API_URL.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+import requests
+from dotenv import load_dotenv
+from artifactstore import Artifact
+from service import LessonRequestError
+
+load_dotenv()
+
+CUSTOMIZER_API_URL = os.getenv("CUSTOMIZER_API_URL", "").rstrip("/")
+CUSTOMIZER_API_TIMEOUT = float(os.getenv("CUSTOMIZER_API_TIMEOUT", "300"))
+REMOTE_ARTIFACT_ENTRIES = 32
+
+_session = requests.Session()
+_artifacts = OrderedDict()
+_artifacts_lock = threading.Lock()
+
+
+def remote_events(resource_id: str, benchmark_code: str, benchmark_id: str, query: str,
+                  history=(), stream: bool = True, dedup_key: str = None):
+    """Same events as service.customize_events, read from the API's NDJSON stream"""
+    payload = {
+        "resource_id": resource_id,
+        "benchmark_code": benchmark_code,
+        "benchmark_id": benchmark_id,
+        "query": query,
+        "history": [
+            {k: entry.get(k, "") for k in ("query", "resource_id", "benchmark", "ai_output")}
+            for entry in history
+        ],
+        "stream": True,
+        "model_stream": stream,
+        "dedup_key": dedup_key,
+    }
+    try:
+        response = _session.post(f"{CUSTOMIZER_API_URL}/v1/customize", json=payload, stream=True, timeout=CUSTOMIZER_API_TIMEOUT)
+    except requests.RequestException as e:
+        raise LessonRequestError(f"❌ The lesson service is unreachable: {e}", status=503)
+    with response:
+        if response.status_code != 200:
+            try:
+                message = response.json().get("error")
+            except ValueError:
+                message = None
+            raise LessonRequestError(message or f"❌ The lesson service returned {response.status_code}.", status=response.status_code)
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("event") == "error":
+                raise LessonRequestError(event.get("error", "❌ The lesson service failed."), status=event.get("status", 500))
+            yield event
+
+
+def fetch_artifact(artifact_id: str):
+    """A worksheet held by the API workers, cached here after the first download; None if gone"""
+    with _artifacts_lock:
+        artifact = _artifacts.get(artifact_id)
+        if artifact is not None:
+            _artifacts.move_to_end(artifact_id)
+            return artifact
+    try:
+        response = _session.get(f"{CUSTOMIZER_API_URL}/v1/artifacts/{artifact_id}", timeout=CUSTOMIZER_API_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"❌ Failed to fetch artifact: {e}")
+        return None
+    if response.status_code != 200:
+        return None
+    filename = response.headers.get("X-Filename") or f"{artifact_id}.bin"
+    artifact = Artifact(artifact_id, response.content, response.headers.get("Content-Type", "application/octet-stream"), filename, 0.0)
+    with _artifacts_lock:
+        _artifacts[artifact_id] = artifact
+        while len(_artifacts) > REMOTE_ARTIFACT_ENTRIES:
+            _artifacts.popitem(last=False)
+    return artifact
@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARTIFACT_TTL = float(os.getenv("ARTIFACT_TTL", "86400"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(128 * 1024 * 1024)))
+# When set, artifacts are kept on disk here so every server process can serve them.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "")
+
+ARTIFACT_SCHEME = "artifact:"
+_ARTIFACT_LINK = re.compile(r'\[([^\]\n]*)\]\(artifact:([0-9a-f]{16})\)')
+_ARTIFACT_ID = re.compile(r'[0-9a-f]{16}')
+
+
+def is_artifact_id(artifact_id) -> bool:
+    """True for ids in the form put() generates; anything else never reaches the filesystem"""
+    return isinstance(artifact_id, str) and _ARTIFACT_ID.fullmatch(artifact_id) is not None
+
+
+class Artifact:
+    __slots__ = ("artifact_id", "data", "mime", "filename", "created_at")
+
+    def __init__(self, artifact_id: str, data: bytes, mime: str, filename: str, created_at: float):
+        self.artifact_id = artifact_id
+        self.data = data
+        self.mime = mime
+        self.filename = filename
+        self.created_at = created_at
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for generated files such as worksheets. Text refers to an
+    artifact by a short id in an artifact:<id> link, so chat content, history and logs stay
+    small; the bytes live here, in memory or under a directory, until the TTL runs out.
+    """
+
+    def __init__(self, ttl: float = ARTIFACT_TTL, max_bytes: int = ARTIFACT_MAX_BYTES, directory: str = ARTIFACT_DIR):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes, mime: str, filename: str) -> str:
+        """Store data and return its id; storing the same bytes again refreshes the TTL"""
+        artifact_id = hashlib.sha256(data).hexdigest()[:16]
+        artifact = Artifact(artifact_id, data, mime, filename, time.time())
+        if self.directory:
+            self._write_disk(artifact)
+        else:
+            self._put_memory(artifact)
+        return artifact_id
+
+    def get(self, artifact_id: str):
+        """Return the Artifact for artifact_id, or None once it has expired or was never stored"""
+        if not is_artifact_id(artifact_id):
+            return None
+        artifact = self._load_disk(artifact_id) if self.directory else self._get_memory(artifact_id)
+        if artifact is None or time.time() - artifact.created_at > self.ttl:
+            return None
+        return artifact
+
+    def _get_memory(self, artifact_id: str):
+        with self._lock:
+            self._evict_expired()
+            return self._entries.get(artifact_id)
+
+    def _put_memory(self, artifact: Artifact):
+        with self._lock:
+            previous = self._entries.pop(artifact.artifact_id, None)
+            if previous is not None:
+                self._size -= len(previous.data)
+            self._entries[artifact.artifact_id] = artifact
+            self._size += len(artifact.data)
+            self._evict_expired()
+            while len(self._entries) > 1 and self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.data)
+
+    def _evict_expired(self):
+        # Entries are kept in insertion order, so expired ones are always at the front.
+        cutoff = time.time() - self.ttl
+        while self._entries:
+            artifact = next(iter(self._entries.values()))
+            if artifact.created_at > cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._size -= len(artifact.data)
+
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, artifact_id)
+
+    def _write_disk(self, artifact: Artifact):
+        meta = {"mime": artifact.mime, "filename": artifact.filename, "created_at": artifact.created_at}
+        path = self._path(artifact.artifact_id)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _atomic_write(path, artifact.data)
+            _atomic_write(path + ".meta.json", json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            print(f"❌ Failed to write artifact {artifact.artifact_id}: {e}")
+            self._put_memory(artifact)
+
+    def _load_disk(self, artifact_id: str):
+        path = self._path(artifact_id)
+        try:
+            with open(path + ".meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta["created_at"] > self.ttl:
+                for stale in (path, path + ".meta.json"):
+                    os.remove(stale)
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except (OSError, ValueError, KeyError):
+            return self._get_memory(artifact_id)
+        return Artifact(artifact_id, data, meta.get("mime", "application/octet-stream"), meta.get("filename", artifact_id), meta["created_at"])
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def artifact_link(label: str, artifact_id: str) -> str:
+    return f"[{label}]({ARTIFACT_SCHEME}{artifact_id})"
+
+
+def find_artifact_links(text: str) -> list:
+    """(label, artifact_id) for each artifact linked in text, once per artifact"""
+    if ARTIFACT_SCHEME not in text:
+        return []
+    links = {}
+    for label, artifact_id in _ARTIFACT_LINK.findall(text):
+        links.setdefault(artifact_id, label)
+    return [(label, artifact_id) for artifact_id, label in links.items()]
+
+
+def remove_artifact_links(text: str) -> str:
+    if ARTIFACT_SCHEME not in text:
+        return text
+    return _ARTIFACT_LINK.sub("", text)
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,96 @@
+import os
+import re
+import json
+from collections import Counter
+from types import MappingProxyType
+from rapidfuzz import process, fuzz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Optional JSON list or one-code-per-line file that replaces the built-in codes below.
+BENCHMARK_CODES_FILE = os.getenv("BENCHMARK_CODES_FILE", "")
+BENCHMARK_MATCH_THRESHOLD = int(os.getenv("BENCHMARK_MATCH_THRESHOLD", "80"))
+# Catalogs at or below this size are scored in full; larger ones are narrowed by trigrams first.
+BENCHMARK_FULL_SCAN_LIMIT = 512
+BENCHMARK_CANDIDATES = 64
+
+DEFAULT_BENCHMARK_CODES = frozenset({
+    'ELA.1.R.1.4', 'ELA.1.R.3.1', 'ELA.4.V.1.3', 'ELA.5.V.1.1', 'ELA.5.V.1.3', 'ELA.6.V.1.3', 'ELA.7.C.1.3',
+    'ELA.7.C.4.1', 'ELA.K.C.1.3', 'ELA.K.R.1.3', 'ELA.K.R.1.4', 'ELA.K.R.2.1', 'ELA.K.R.2.2', 'ELA.K.R.3.1',
+    'ELA.K12.EE.1.1', 'ELA.K12.EE.2.1', 'ELA.K12.EE.3.1', 'ELA.K12.EE.4.1', 'ELA.K12.EE.6.1', 'MA.1.AR.1.1',
+    'MA.1.GR.1.3', 'MA.1.NSO.1.1', 'MA.1.NSO.2.2', 'MA.1.NSO.2.4', 'MA.1.NSO.2.5', 'MA.2.AR.3.1', 'MA.2.AR.3.2',
+    'MA.3.AR.1.1', 'MA.3.NSO.2.2', 'MA.3.NSO.2.4', 'MA.4.DP.1.2', 'MA.5.DP.1.2', 'MA.5.M.1.1', 'MA.5.NSO.2.4',
+    'MA.5.NSO.2.5', 'MA.6.AR.3.2', 'MA.6.DP.1.2', 'MA.6.DP.1.3', 'MA.6.DP.1.4', 'MA.6.DP.1.5', 'MA.6.DP.1.6',
+    'MA.6.GR.2.3', 'MA.6.GR.2.4', 'MA.6.NSO.2.3', 'MA.7.AR.3.1', 'MA.7.DP.1.1', 'MA.7.DP.1.2', 'MA.7.DP.1.5',
+    'MA.7.DP.2.1', 'MA.8.F.1.3', 'MA.912.AR.1.3', 'MA.912.DP.1.1', 'MA.912.DP.1.2', 'MA.912.DP.1.4', 'MA.912.DP.2.1',
+    'MA.912.DP.2.2', 'MA.912.DP.3.5', 'MA.912.T.3.3', 'MA.K.AR.1.1', 'MA.K.AR.1.2', 'MA.K.AR.1.3', 'MA.K.DP.1.1',
+    'MA.K.GR.1.1', 'MA.K.GR.1.2', 'MA.K.GR.1.5', 'MA.K.M.1.2', 'MA.K.M.1.3', 'MA.K.NSO.1.1', 'MA.K.NSO.1.2',
+    'MA.K.NSO.1.4', 'MA.K.NSO.2.1', 'MA.K.NSO.2.3', 'MA.K.NSO.3.1', 'MA.K.NSO.3.2', 'SS.7.CG.3.13', 'SS.7.CG.4.2',
+    'SS.K.CG.2.2', 'SS.K.CG.2.4'
+})
+
+_NON_ALNUM = re.compile(r'[^A-Za-z0-9]')
+
+
+def clean_benchmark_code(code: str) -> str:
+    return _NON_ALNUM.sub('', code).upper()
+
+
+def _trigrams(cleaned: str) -> set:
+    padded = f"  {cleaned} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def load_benchmark_codes(path: str = BENCHMARK_CODES_FILE) -> frozenset:
+    if not path:
+        return DEFAULT_BENCHMARK_CODES
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            codes = json.load(f)
+        else:
+            codes = [line.strip() for line in f if line.strip()]
+    return frozenset(codes)
+
+
+class BenchmarkIndex:
+    """Immutable lookup structures for canonical benchmark codes, built once."""
+
+    def __init__(self, codes):
+        self.codes = frozenset(codes)
+        self.by_cleaned = MappingProxyType({clean_benchmark_code(code): code for code in sorted(self.codes)})
+        self.choices = tuple(self.by_cleaned.keys())
+        trigram_index = {}
+        for cleaned in self.choices:
+            for gram in _trigrams(cleaned):
+                trigram_index.setdefault(gram, []).append(cleaned)
+        self.trigram_index = MappingProxyType({gram: tuple(values) for gram, values in trigram_index.items()})
+
+    def _candidates(self, cleaned: str):
+        if len(self.choices) <= BENCHMARK_FULL_SCAN_LIMIT:
+            return self.choices
+        shared = Counter()
+        for gram in _trigrams(cleaned):
+            shared.update(self.trigram_index.get(gram, ()))
+        return [code for code, _ in shared.most_common(BENCHMARK_CANDIDATES)]
+
+    def normalize(self, user_input: str):
+        """Return the canonical code for user_input, an exact or close-enough match, or None"""
+        cleaned = clean_benchmark_code(user_input)
+        exact = self.by_cleaned.get(cleaned)
+        if exact:
+            return exact
+
+        candidates = self._candidates(cleaned)
+        if not candidates:
+            return None
+        match = process.extractOne(cleaned, candidates, scorer=fuzz.ratio, score_cutoff=BENCHMARK_MATCH_THRESHOLD)
+        return self.by_cleaned[match[0]] if match else None
+
+
+benchmark_index = BenchmarkIndex(load_benchmark_codes())
+allowed_benchmark_codes = benchmark_index.codes
+
+
+def normalize_benchmark_code(user_input):
+    return benchmark_index.normalize(user_input)
@@ -0,0 +1,109 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BLOB_POOL_CONNECTIONS = int(os.getenv("BLOB_POOL_CONNECTIONS", "10"))
+BLOB_POOL_MAXSIZE = int(os.getenv("BLOB_POOL_MAXSIZE", "20"))
+
+_lock = threading.Lock()
+_session = None
+_service_clients = {}
+_container_clients = {}
+_metrics_hooks = []
+_counters = {
+    "service_clients_created": 0,
+    "service_clients_reused": 0,
+    "container_clients_created": 0,
+    "container_clients_reused": 0,
+}
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=BLOB_POOL_CONNECTIONS, pool_maxsize=BLOB_POOL_MAXSIZE)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def get_blob_service_client(connection_string: str = None) -> BlobServiceClient:
+    """Return the process-wide BlobServiceClient for a connection string, creating it once"""
+    connection_string = connection_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if not connection_string:
+        raise ValueError("❌ AZURE_STORAGE_CONNECTION_STRING not found in environment.")
+
+    with _lock:
+        client = _service_clients.get(connection_string)
+        if client is None:
+            transport = RequestsTransport(session=_get_session(), session_owner=False)
+            client = BlobServiceClient.from_connection_string(connection_string, transport=transport)
+            _service_clients[connection_string] = client
+            _counters["service_clients_created"] += 1
+        else:
+            _counters["service_clients_reused"] += 1
+    return client
+
+
+def get_container_client(container_name: str, connection_string: str = None):
+    """Return the shared ContainerClient for a container, creating it once"""
+    service_client = get_blob_service_client(connection_string)
+    key = (id(service_client), container_name)
+    with _lock:
+        client = _container_clients.get(key)
+        if client is None:
+            client = service_client.get_container_client(container_name)
+            _container_clients[key] = client
+            _counters["container_clients_created"] += 1
+        else:
+            _counters["container_clients_reused"] += 1
+    _report_metrics()
+    return client
+
+
+def get_blob_client(container_name: str, blob_name: str, connection_string: str = None):
+    return get_container_client(container_name, connection_string).get_blob_client(blob_name)
+
+
+def get_pool_stats() -> dict:
+    """Client registry counters plus socket reuse figures from the shared HTTP pool"""
+    with _lock:
+        stats = dict(_counters)
+    connections_opened = 0
+    requests_sent = 0
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in list(pools.keys()):
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                connections_opened += pool.num_connections
+                requests_sent += pool.num_requests
+    stats["connections_opened"] = connections_opened
+    stats["requests_sent"] = requests_sent
+    stats["connections_reused"] = max(0, requests_sent - connections_opened)
+    return stats
+
+
+def register_metrics_hook(hook):
+    """Register a callable that receives get_pool_stats() each time a client is handed out"""
+    _metrics_hooks.append(hook)
+
+
+def _report_metrics():
+    if not _metrics_hooks:
+        return
+    stats = get_pool_stats()
+    for hook in list(_metrics_hooks):
+        try:
+            hook(stats)
+        except Exception as e:
+            print(f"❌ Blob metrics hook failed: {e}")
@@ -0,0 +1,125 @@
+import os
+import re
+import math
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONTEXT_DOCS_TOKEN_BUDGET = int(os.getenv("CONTEXT_DOCS_TOKEN_BUDGET", "3000"))
+CONTEXT_CHUNKS_TOKEN_BUDGET = int(os.getenv("CONTEXT_CHUNKS_TOKEN_BUDGET", "6000"))
+CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.8"))
+# A text that does not fit is cut to the remaining budget if at least this many tokens remain.
+CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "200"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+_WORD = re.compile(r"\w+")
+_SHINGLE_SIZE = 8
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Exact token count with tiktoken, or roughly four characters per token without it"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of text within max_tokens, cut back to a word boundary where possible"""
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        prefix = _encoding.decode(tokens[:max_tokens])
+    else:
+        if len(text) <= max_tokens * 4:
+            return text
+        prefix = text[:max_tokens * 4]
+    cut = prefix.rfind(" ", len(prefix) // 2)
+    return (prefix[:cut] if cut > 0 else prefix).rstrip()
+
+
+def _terms(text: str) -> list:
+    return _WORD.findall(text.lower())
+
+
+def _shingles(terms: list) -> set:
+    if len(terms) <= _SHINGLE_SIZE:
+        return {tuple(terms)} if terms else set()
+    return {tuple(terms[i:i + _SHINGLE_SIZE]) for i in range(len(terms) - _SHINGLE_SIZE + 1)}
+
+
+def rank_by_relevance(texts: list, query: str) -> list:
+    """Order texts by BM25 score against the query, keeping the original order for ties"""
+    query_terms = set(_terms(query))
+    if not texts or not query_terms:
+        return list(texts)
+
+    docs = [Counter(_terms(t)) for t in texts]
+    lengths = [sum(d.values()) for d in docs]
+    avg_length = (sum(lengths) / len(lengths)) or 1.0
+    n = len(docs)
+    k1, b = 1.5, 0.75
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for d in docs if term in d)
+        idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(i):
+        total = 0.0
+        for term in query_terms:
+            tf = docs[i].get(term, 0)
+            if not tf:
+                continue
+            total += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[i] / avg_length))
+        return total
+
+    order = sorted(range(n), key=lambda i: -score(i))
+    return [texts[i] for i in order]
+
+
+def pack_section(name: str, texts: list, query: str, budget: int, separator: str = "\n\n") -> str:
+    """
+    Fill a token budget with the most relevant texts, skipping exact and overlapping duplicates,
+    and log how much of the budget the section used. A text too long for what is left is cut
+    to fit when at least CONTEXT_MIN_TRUNCATED_TOKENS remain, so one long top-ranked text is
+    not dropped in favour of shorter, less relevant ones.
+    """
+    selected = []
+    covered = set()
+    used = 0
+    dropped_duplicates = 0
+    dropped_budget = 0
+    truncated = 0
+
+    for text in rank_by_relevance([t for t in texts if t and t.strip()], query):
+        shingles = _shingles(_terms(text))
+        if shingles and len(shingles & covered) / len(shingles) >= CONTEXT_DEDUPE_THRESHOLD:
+            dropped_duplicates += 1
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining < CONTEXT_MIN_TRUNCATED_TOKENS:
+                dropped_budget += 1
+                continue
+            text = truncate_to_tokens(text, remaining)
+            tokens = count_tokens(text)
+            truncated += 1
+        selected.append(text)
+        covered |= shingles
+        used += tokens
+
+    print(f"📏 Context '{name}': {used}/{budget} tokens, {len(selected)} kept ({truncated} truncated), "
+          f"{dropped_duplicates} duplicate(s) and {dropped_budget} over budget dropped")
+    return separator.join(selected)
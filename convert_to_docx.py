@@ -0,0 +1,78 @@
+from docx import Document
+
+_BULLETS = ("- ", "* ", "• ")
+
+
+class DocxWriter:
+    """
+    Builds a DOCX from a stream of lines in one pass. Blank lines are dropped, # headings and
+    -, * or • bullets get Word's heading and list styles, and **bold** spans become bold runs.
+    Markup is split once per line, so long or malformed lines cost linear time, and an
+    unmatched ** is kept as literal text.
+    """
+
+    def __init__(self, title: str = "CPALMS Lesson Plan"):
+        self.doc = Document()
+        self.doc.add_heading(title, level=0)
+        self._styles = {}
+        self._started = False
+
+    def _style(self, name: str):
+        style = self._styles.get(name)
+        if style is None:
+            style = self._styles[name] = self.doc.styles[name]
+        return style
+
+    def add_line(self, line: str):
+        text = line.strip()
+        if not text:
+            return
+        if text.startswith("#"):
+            level = len(text) - len(text.lstrip("#"))
+            heading = text[level:].strip().replace("**", "")
+            if heading:
+                self.doc.add_paragraph(heading, style=self._style(f"Heading {min(level, 6)}"))
+            return
+        if text.startswith(_BULLETS):
+            paragraph = self.doc.add_paragraph(style=self._style("List Bullet"))
+            text = text[2:].lstrip()
+        else:
+            paragraph = self.doc.add_paragraph()
+            # Only the first line loses its indentation, like the old strip() of the whole content.
+            if self._started:
+                text = line.rstrip()
+        self._started = True
+        self._add_runs(paragraph, text)
+
+    @staticmethod
+    def _add_runs(paragraph, text: str):
+        parts = text.split("**")
+        if len(parts) % 2 == 0:
+            # Odd number of markers: the last one has no partner and stays literal.
+            parts[-2:] = [f"{parts[-2]}**{parts[-1]}"]
+        for i, part in enumerate(parts):
+            if not part:
+                continue
+            run = paragraph.add_run(part)
+            if i % 2:
+                run.bold = True
+
+    def write(self, lines):
+        for line in lines:
+            self.add_line(line)
+        return self.doc
+
+
+def _lines(content):
+    return content.split("\n") if isinstance(content, str) else content
+
+
+def generate_docx_file(content, title: str = "CPALMS Lesson Plan"):
+    """Build the Document for content, a string or any iterable of lines"""
+    return DocxWriter(title).write(_lines(content))
+
+
+def write_docx(content, output, title: str = "CPALMS Lesson Plan"):
+    """Build the DOCX for content and save it to output, a path or binary file-like"""
+    generate_docx_file(content, title=title).save(output)
+    return output
@@ -3,47 +3,73 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT
 from io import BytesIO
+import tempfile
 import re
 
+_CAPS_WORD = re.compile(r'\b[A-Z]{3,}\b')
+
 def format_with_icons_and_bold(text: str):
-    def bold_caps_words(match):
-        word = match.group()
-        return f"<b>{word}</b>"
+    return _CAPS_WORD.sub(r'<b>\g<0></b>', text)
+
+
+class PDFRenderer:
+    """
+    Lays out lesson text as a PDF. The stylesheet is built once per renderer and each line is
+    classified by a single lowercase prefix lookup. Lines may come from a file or generator,
+    but reportlab lays out the whole story at once, so every flowable is held in memory
+    until the document is built.
+    """
+
+    def __init__(self):
+        self.styles = getSampleStyleSheet()
+        self.styles.add(ParagraphStyle(name='Header', fontSize=14, leading=16, spaceAfter=10, spaceBefore=20, fontName="Helvetica-Bold"))
+        self.styles.add(ParagraphStyle(name='Question', fontSize=12, leading=15, spaceBefore=10, spaceAfter=4, fontName="Helvetica-Bold"))
+        self.styles.add(ParagraphStyle(name='Indented', fontSize=11, leading=14, leftIndent=20, spaceAfter=6))
+        self.styles.add(ParagraphStyle(name='Answer', fontSize=11, leading=14, leftIndent=30, textColor="#444444", fontName="Helvetica-Oblique"))
+        # First matching prefix wins; anything else is a Normal paragraph.
+        self.dispatch = (
+            (("question",), self.styles['Question']),
+            (("objective:",), self.styles['Indented']),
+            (("student writes:", "correct answer:", "answer:"), self.styles['Answer']),
+        )
+
+    def style_for(self, line: str):
+        lowered = line[:16].lower()
+        for prefixes, style in self.dispatch:
+            if lowered.startswith(prefixes):
+                return style
+        return self.styles['Normal']
+
+    def flowables(self, lines, title="CPALMS Lesson Plan"):
+        yield Paragraph(f"<b>{title}</b>", self.styles['Header'])
+        yield Spacer(1, 12)
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                yield Spacer(1, 8)
+                continue
+            yield Paragraph(format_with_icons_and_bold(stripped), self.style_for(stripped))
+
+    def render(self, lines, output=None, title="CPALMS Lesson Plan"):
+        """
+        Write the PDF for lines (a string or any iterable of lines) to output, a path or
+        binary file-like. Without output the PDF goes to a temporary file whose path is returned;
+        pass a path rather than a BytesIO to keep the finished PDF out of memory.
+        """
+        if isinstance(lines, str):
+            lines = lines.split('\n')
+        if output is None:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                output = tmp.name
+        doc = SimpleDocTemplate(output, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=60, bottomMargin=60)
+        doc.build(list(self.flowables(lines, title)))
+        return output
+
 
-    text = re.sub(r'\b[A-Z]{3,}\b', bold_caps_words, text)
-    return text
+pdf_renderer = PDFRenderer()
 
 def generate_structured_pdf(text: str, title="CPALMS Lesson Plan"):
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=60, bottomMargin=60)
-    story = []
-
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Header', fontSize=14, leading=16, spaceAfter=10, spaceBefore=20, fontName="Helvetica-Bold"))
-    styles.add(ParagraphStyle(name='Question', fontSize=12, leading=15, spaceBefore=10, spaceAfter=4, fontName="Helvetica-Bold"))
-    styles.add(ParagraphStyle(name='Indented', fontSize=11, leading=14, leftIndent=20, spaceAfter=6))
-    styles.add(ParagraphStyle(name='Answer', fontSize=11, leading=14, leftIndent=30, textColor="#444444", fontName="Helvetica-Oblique"))
-
-    story.append(Paragraph(f"<b>{title}</b>", styles['Header']))
-    story.append(Spacer(1, 12))
-
-    lines = text.split('\n')
-    for line in lines:
-        stripped = line.strip()
-        if not stripped:
-            story.append(Spacer(1, 8))
-            continue
-
-        formatted = format_with_icons_and_bold(stripped)
-        if stripped.lower().startswith("question"):
-            story.append(Paragraph(formatted, styles['Question']))
-        elif stripped.lower().startswith("objective:"):
-            story.append(Paragraph(formatted, styles['Indented']))
-        elif stripped.lower().startswith("student writes:") or stripped.lower().startswith("correct answer:") or stripped.lower().startswith("answer:"):
-            story.append(Paragraph(formatted, styles['Answer']))
-        else:
-            story.append(Paragraph(formatted, styles['Normal']))
-
-    doc.build(story)
+    pdf_renderer.render(text, buffer, title=title)
     buffer.seek(0)
     return buffer
@@ -0,0 +1,283 @@
+"""
+Offline pack of the lessonplans/ tree, so lesson lookups never leave the machine.
+
+    python corpuspack.py build --out lessons.pack
+    python corpuspack.py build --dir ./lesson_cache --out lessons.pack
+    python corpuspack.py info lessons.pack
+
+The pack is one file: zlib-compressed lesson JSON, then a string table and a fixed-width
+index sorted by "resource_id NUL benchmark". Readers mmap it read-only, so every worker
+process shares the same page-cache copy, and a lookup is a binary search plus one
+decompress. Rebuilding replaces the file atomically; readers notice the new file within
+LESSON_PACK_CHECK_INTERVAL seconds and switch to it.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LESSON_PACK_PATH = os.getenv("LESSON_PACK_PATH", "")
+LESSON_CONTAINER = "cpalmsnewdata"
+LESSON_PREFIX = "lessonplans/"
+PACK_BUILD_WORKERS = int(os.getenv("PACK_BUILD_WORKERS", "16"))
+LESSON_PACK_CHECK_INTERVAL = float(os.getenv("LESSON_PACK_CHECK_INTERVAL", "5"))
+LESSON_PACK_RETRY_INTERVAL = float(os.getenv("LESSON_PACK_RETRY_INTERVAL", "60"))
+
+_MAGIC = b"CPLPACK\x01"
+# magic, entry count, string table offset, index offset
+_HEADER = struct.Struct("<8sIQQ")
+# string offset, key length, etag length, data offset, compressed length, raw length
+_RECORD = struct.Struct("<IHHQII")
+_KEY_SEP = "\x00"
+
+
+def _key(resource_id, benchmark: str = "") -> bytes:
+    return f"{resource_id}{_KEY_SEP}{benchmark}".encode("utf-8")
+
+
+def parse_lesson_path(blob_path: str):
+    """(benchmark, resource_id) for lessonplans/{benchmark}/{resource_id}.json, else None"""
+    parts = blob_path.split("/")
+    if len(parts) != 3 or parts[0] + "/" != LESSON_PREFIX or not parts[2].endswith(".json"):
+        return None
+    return parts[1], parts[2][:-len(".json")]
+
+
+class LessonPack:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._strings_offset, self._index_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a lesson pack")
+
+    def _record(self, i: int):
+        return _RECORD.unpack_from(self._mm, self._index_offset + i * _RECORD.size)
+
+    def _key_at(self, i: int) -> bytes:
+        string_offset, key_len, _, _, _, _ = self._record(i)
+        start = self._strings_offset + string_offset
+        return self._mm[start:start + key_len]
+
+    def _find(self, key: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _lookup(self, benchmark: str, resource_id):
+        key = _key(resource_id, benchmark)
+        i = self._find(key)
+        if i < self.count and self._key_at(i) == key:
+            return self._record(i)
+        return None
+
+    def get_bytes(self, benchmark: str, resource_id):
+        record = self._lookup(benchmark, resource_id)
+        if record is None:
+            return None
+        _, _, _, data_offset, data_len, raw_len = record
+        return zlib.decompress(self._mm[data_offset:data_offset + data_len], bufsize=raw_len)
+
+    def get_json(self, benchmark: str, resource_id):
+        data = self.get_bytes(benchmark, resource_id)
+        return json.loads(data) if data is not None else None
+
+    def etag(self, benchmark: str, resource_id):
+        record = self._lookup(benchmark, resource_id)
+        if record is None:
+            return None
+        string_offset, key_len, etag_len, _, _, _ = record
+        start = self._strings_offset + string_offset + key_len
+        return self._mm[start:start + etag_len].decode("utf-8") or None
+
+    def benchmarks_for(self, resource_id) -> list:
+        """Every benchmark the resource is filed under"""
+        prefix = _key(resource_id)
+        benchmarks = []
+        i = self._find(prefix)
+        while i < self.count:
+            key = self._key_at(i)
+            if not key.startswith(prefix):
+                break
+            benchmarks.append(key[len(prefix):].decode("utf-8"))
+            i += 1
+        return benchmarks
+
+    def __contains__(self, resource_id) -> bool:
+        return bool(self.benchmarks_for(resource_id))
+
+    def close(self):
+        self._mm.close()
+
+
+_pack = None
+_pack_stamp = None
+_pack_next_check = 0.0
+_pack_lock = threading.Lock()
+
+
+def _file_stamp(path: str):
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def get_lesson_pack():
+    """
+    The pack at LESSON_PACK_PATH; None if unset or unreadable. The file is re-checked every
+    LESSON_PACK_CHECK_INTERVAL seconds and reopened when a rebuild has replaced it. A failed
+    open is retried after LESSON_PACK_RETRY_INTERVAL.
+    """
+    global _pack, _pack_stamp, _pack_next_check
+    if not LESSON_PACK_PATH:
+        return None
+    if time.monotonic() < _pack_next_check:
+        return _pack
+    with _pack_lock:
+        now = time.monotonic()
+        if now < _pack_next_check:
+            return _pack
+        try:
+            stamp = _file_stamp(LESSON_PACK_PATH)
+            if stamp != _pack_stamp:
+                # The old pack is left to the garbage collector: other threads may still be reading it.
+                _pack = LessonPack(LESSON_PACK_PATH)
+                _pack_stamp = stamp
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Lesson pack unavailable, using {'the previous pack' if _pack else 'blob storage'}: {e}")
+            _pack_next_check = now + LESSON_PACK_RETRY_INTERVAL
+            return _pack
+        _pack_next_check = now + LESSON_PACK_CHECK_INTERVAL
+        return _pack
+
+
+def container_lessons(container_name: str = LESSON_CONTAINER, workers: int = PACK_BUILD_WORKERS):
+    """Yield (blob_path, etag, data) for every lesson in the container"""
+    from blobclients import get_container_client
+    container = get_container_client(container_name)
+
+    def download(blob):
+        return blob.name, blob.etag, container.download_blob(blob.name).readall()
+
+    # A sliding window of downloads, so the packer's memory does not grow with the corpus.
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pack-download") as executor:
+        for blob in container.list_blobs(name_starts_with=LESSON_PREFIX):
+            if not parse_lesson_path(blob.name):
+                continue
+            pending.append(executor.submit(download, blob))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def directory_lessons(root: str):
+    """Yield (blob_path, etag, data) from a directory in LessonCache's disk layout"""
+    base = os.path.join(root, *LESSON_PREFIX.strip("/").split("/"))
+    for dirpath, _, filenames in os.walk(base):
+        for filename in sorted(filenames):
+            if not filename.endswith(".json") or filename.endswith(".meta.json"):
+                continue
+            path = os.path.join(dirpath, filename)
+            blob_path = os.path.relpath(path, root).replace(os.sep, "/")
+            if not parse_lesson_path(blob_path):
+                continue
+            etag = ""
+            try:
+                with open(path + ".meta.json", "r", encoding="utf-8") as f:
+                    etag = json.load(f).get("etag") or ""
+            except (OSError, ValueError):
+                pass
+            with open(path, "rb") as f:
+                yield blob_path, etag, f.read()
+
+
+def build_pack(lessons, out_path: str) -> dict:
+    """Write lessons ((blob_path, etag, data) tuples) to out_path; identical payloads are stored once"""
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    entries = []
+    stored = {}
+    raw_bytes = 0
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, 0, 0, 0))
+        for blob_path, etag, data in lessons:
+            benchmark, resource_id = parse_lesson_path(blob_path)
+            digest = hashlib.sha256(data).digest()
+            location = stored.get(digest)
+            if location is None:
+                compressed = zlib.compress(data, 9)
+                location = stored[digest] = (f.tell(), len(compressed), len(data))
+                f.write(compressed)
+            raw_bytes += len(data)
+            entries.append((_key(resource_id, benchmark), (etag or "").encode("utf-8"), location))
+
+        entries.sort(key=lambda entry: entry[0])
+        strings_offset = f.tell()
+        records = []
+        string_offset = 0
+        for key, etag, (data_offset, data_len, raw_len) in entries:
+            f.write(key)
+            f.write(etag)
+            records.append(_RECORD.pack(string_offset, len(key), len(etag), data_offset, data_len, raw_len))
+            string_offset += len(key) + len(etag)
+        index_offset = f.tell()
+        f.write(b"".join(records))
+        size = f.tell()
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, len(entries), strings_offset, index_offset))
+    os.replace(tmp_path, out_path)
+    return {"lessons": len(entries), "unique": len(stored), "raw_bytes": raw_bytes, "pack_bytes": size}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the offline lesson pack")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="pack every lesson plan into one file")
+    source = build.add_mutually_exclusive_group()
+    source.add_argument("--container", default=LESSON_CONTAINER, help="blob container to download from")
+    source.add_argument("--dir", help="local copy in the lesson cache layout instead of blob storage")
+    build.add_argument("--out", default=LESSON_PACK_PATH or "lessons.pack", help="pack file to write")
+    build.add_argument("--workers", type=int, default=PACK_BUILD_WORKERS, help="parallel blob downloads")
+    info = commands.add_parser("info", help="summarise a pack")
+    info.add_argument("path", nargs="?", default=LESSON_PACK_PATH or "lessons.pack")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        lessons = directory_lessons(args.dir) if args.dir else container_lessons(args.container, args.workers)
+        stats = build_pack(lessons, args.out)
+        print(f"✅ Packed {stats['lessons']} lessons ({stats['unique']} unique) into {args.out}: "
+              f"{stats['raw_bytes'] / 1e6:.1f} MB -> {stats['pack_bytes'] / 1e6:.1f} MB")
+    else:
+        pack = LessonPack(args.path)
+        resources = set()
+        benchmarks = set()
+        for i in range(pack.count):
+            resource_id, benchmark = pack._key_at(i).decode("utf-8").split(_KEY_SEP)
+            resources.add(resource_id)
+            benchmarks.add(benchmark)
+        json.dump({"lessons": pack.count, "resources": len(resources), "benchmarks": len(benchmarks),
+                   "bytes": os.path.getsize(args.path)}, sys.stdout, indent=2)
+        print()
+        pack.close()
+
+
+if __name__ == "__main__":
+    main()
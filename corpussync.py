@@ -0,0 +1,212 @@
+"""
+Keep the local lesson cache in step with blob storage without downloading it again.
+
+    python corpussync.py --dir ./lesson_cache
+    python corpussync.py --dir ./lesson_cache --pack lessons.pack
+
+One paged listing of lessonplans/ is compared with a manifest of the ETags already held.
+Only new or changed blobs are downloaded, by a bounded pool, into LessonCache's disk
+layout, which is the directory get_blob_data reads through LESSON_CACHE_DIR. Blobs gone
+from the container are removed. Each finished download is appended to a journal, so an
+interrupted run picks up where it stopped. With --pack the lesson pack is rebuilt from the
+directory afterwards and swapped in with a rename.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from lessoncache import LessonCache, lesson_cache, LESSON_CACHE_DIR
+from corpuspack import LESSON_CONTAINER, LESSON_PREFIX, parse_lesson_path, build_pack, directory_lessons
+
+load_dotenv()
+
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "16"))
+MANIFEST_NAME = "lessonplans.manifest.json"
+JOURNAL_NAME = "lessonplans.manifest.journal"
+
+
+class Manifest:
+    """blob_path -> {"etag", "last_modified", "size"} for the blobs held locally"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.journal_path = os.path.join(root, JOURNAL_NAME)
+        self.entries = {}
+        self._journal = None
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = self._from_cache_meta()
+        except ValueError as e:
+            print(f"⚠️ Manifest unreadable, rebuilding it from the cache: {e}")
+            self.entries = self._from_cache_meta()
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by the interruption
+                    if change.get("deleted"):
+                        self.entries.pop(change["path"], None)
+                    else:
+                        self.entries[change.pop("path")] = change
+        except FileNotFoundError:
+            pass
+
+    def _from_cache_meta(self) -> dict:
+        """Seed a first manifest from the .meta.json files LessonCache already wrote"""
+        entries = {}
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, *LESSON_PREFIX.strip("/").split("/"))):
+            for filename in filenames:
+                if not filename.endswith(".json.meta.json"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                blob_path = os.path.relpath(path, self.root).replace(os.sep, "/")[:-len(".meta.json")]
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    size = os.path.getsize(path[:-len(".meta.json")])
+                except (OSError, ValueError):
+                    continue
+                entries[blob_path] = {"etag": meta.get("etag"), "last_modified": meta.get("last_modified", ""), "size": size}
+        return entries
+
+    def _append(self, change: dict):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(change) + "\n")
+        self._journal.flush()
+
+    def record(self, blob_path: str, etag: str, last_modified: str, size: int):
+        self.entries[blob_path] = {"etag": etag, "last_modified": last_modified, "size": size}
+        self._append({"path": blob_path, **self.entries[blob_path]})
+
+    def remove(self, blob_path: str):
+        self.entries.pop(blob_path, None)
+        self._append({"path": blob_path, "deleted": True})
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def commit(self):
+        """Fold the journal into the manifest file"""
+        self.close()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+
+def _changed(entry: dict, blob) -> bool:
+    if entry is None:
+        return True
+    if blob.etag and entry.get("etag"):
+        return blob.etag != entry["etag"]
+    last_modified = blob.last_modified.isoformat() if blob.last_modified else ""
+    return last_modified != entry.get("last_modified") or blob.size != entry.get("size")
+
+
+def sync_corpus(root: str = LESSON_CACHE_DIR, container_name: str = LESSON_CONTAINER,
+                workers: int = SYNC_WORKERS, pack_path: str = "") -> dict:
+    """Bring root up to date with the container; returns counts and bytes transferred"""
+    if not root:
+        raise ValueError("❌ No cache directory given and LESSON_CACHE_DIR is not set.")
+    from blobclients import get_container_client
+    container = get_container_client(container_name)
+    # Writing through the app's own cache also refreshes lessons it holds in memory.
+    same_dir = LESSON_CACHE_DIR and os.path.abspath(root) == os.path.abspath(LESSON_CACHE_DIR)
+    cache = lesson_cache if same_dir else LessonCache(cache_dir=root)
+    manifest = Manifest(root)
+    manifest.load()
+    started = time.time()
+    report = {"listed": 0, "unchanged": 0, "downloaded": 0, "deleted": 0, "failed": 0, "bytes": 0}
+
+    def download(blob_path):
+        downloader = container.download_blob(blob_path)
+        data = downloader.readall()
+        properties = downloader.properties
+        last_modified = properties.last_modified.isoformat() if properties.last_modified else ""
+        if not cache.store(blob_path, data, properties.etag, last_modified):
+            raise OSError(f"{blob_path} could not be written to {root}")
+        return blob_path, properties.etag, last_modified, len(data)
+
+    def finish(future):
+        try:
+            blob_path, etag, last_modified, size = future.result()
+        except Exception as e:
+            report["failed"] += 1
+            print(f"❌ Failed to sync blob: {e}")
+            return
+        manifest.record(blob_path, etag, last_modified, size)
+        report["downloaded"] += 1
+        report["bytes"] += size
+
+    seen = set()
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="corpus-sync") as executor:
+            for blob in container.list_blobs(name_starts_with=LESSON_PREFIX):
+                if not parse_lesson_path(blob.name):
+                    continue
+                report["listed"] += 1
+                seen.add(blob.name)
+                if not _changed(manifest.entries.get(blob.name), blob):
+                    report["unchanged"] += 1
+                    continue
+                pending.append(executor.submit(download, blob.name))
+                while len(pending) >= workers * 2 or (pending and pending[0].done()):
+                    finish(pending.popleft())
+            while pending:
+                finish(pending.popleft())
+
+        for blob_path in [path for path in manifest.entries if path not in seen]:
+            cache.discard(blob_path)
+            manifest.remove(blob_path)
+            report["deleted"] += 1
+    finally:
+        # An interrupted run leaves the journal in place for the next one to replay.
+        manifest.close()
+    manifest.commit()
+
+    if pack_path and (report["downloaded"] or report["deleted"] or not os.path.exists(pack_path)):
+        report["pack"] = build_pack(directory_lessons(root), pack_path)
+    report["seconds"] = round(time.time() - started, 1)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download new and changed lesson plans into the local cache")
+    parser.add_argument("--dir", default=LESSON_CACHE_DIR, help="cache directory (defaults to LESSON_CACHE_DIR)")
+    parser.add_argument("--container", default=LESSON_CONTAINER, help="blob container holding lessonplans/")
+    parser.add_argument("--workers", type=int, default=SYNC_WORKERS, help="parallel downloads")
+    parser.add_argument("--pack", default="", help="rebuild this lesson pack when anything changed")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = sync_corpus(args.dir, args.container, args.workers, args.pack)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"✅ {report['listed']} lessons listed: {report['downloaded']} downloaded "
+              f"({report['bytes'] / 1e6:.1f} MB), {report['unchanged']} unchanged, "
+              f"{report['deleted']} deleted, {report['failed']} failed in {report['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import os
+import time
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from convert_to_docx import write_docx
+from convert_to_pdf import generate_structured_pdf
+from tracing import span
+
+load_dotenv()
+
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 0 builds exports on the calling thread instead of in worker processes.
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "16"))
+EXPORT_SUBMIT_TIMEOUT = float(os.getenv("EXPORT_SUBMIT_TIMEOUT", "5"))
+EXPORT_TIMEOUT = float(os.getenv("EXPORT_TIMEOUT", "120"))
+# Finished jobs nobody collected are forgotten after this many seconds.
+EXPORT_JOB_TTL = float(os.getenv("EXPORT_JOB_TTL", "600"))
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _build_docx(text: str, title: str) -> bytes:
+    return write_docx(text, BytesIO(), title=title).getvalue()
+
+
+def _build_pdf(text: str, title: str) -> bytes:
+    return generate_structured_pdf(text, title=title).getvalue()
+
+
+EXPORT_FORMATS = {
+    "docx": {
+        "build": _build_docx,
+        "mime": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "extension": "docx",
+    },
+    "pdf": {
+        "build": _build_pdf,
+        "mime": "application/pdf",
+        "extension": "pdf",
+    },
+}
+
+
+def build_export(fmt: str, text: str, title: str) -> bytes:
+    """Build one export file; runs inside the worker processes"""
+    return EXPORT_FORMATS[fmt]["build"](text, title)
+
+
+def export_key(fmt: str, text: str, title: str) -> tuple:
+    digest = hashlib.sha256(f"{title}\0{text}".encode("utf-8")).hexdigest()
+    return fmt, digest
+
+
+class ExportCache:
+    """
+    LRU of finished export files keyed by (format, sha256 of title and text), bounded by bytes.
+    Files are only built when a download is requested; repeat downloads of the same content
+    are served from here.
+    """
+
+    def __init__(self, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "builds": 0, "evictions": 0}
+
+    def get(self, fmt: str, text: str, title: str):
+        """Return the cached file bytes, or None if this export has not been built yet"""
+        key = export_key(fmt, text, title)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+            return data
+
+    def build(self, fmt: str, text: str, title: str) -> bytes:
+        """Return the file bytes, building and caching them on the first request"""
+        data = self.get(fmt, text, title)
+        if data is not None:
+            return data
+        data = build_export(fmt, text, title)
+        self.put(fmt, text, title, data)
+        return data
+
+    def put(self, fmt: str, text: str, title: str, data: bytes):
+        self._put(export_key(fmt, text, title), data)
+
+    def _put(self, key, data: bytes):
+        with self._lock:
+            if key in self._entries:
+                return
+            self.counters["builds"] += 1
+            self._entries[key] = data
+            self._size += len(data)
+            while len(self._entries) > 1 and self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.counters["evictions"] += 1
+
+
+export_cache = ExportCache()
+
+
+class ExportQueueFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("future", "waiters", "submitted_at")
+
+    def __init__(self, future: Future):
+        self.future = future
+        self.waiters = 1
+        self.submitted_at = time.monotonic()
+
+    def failed(self) -> bool:
+        return self.future.done() and (self.future.cancelled() or self.future.exception() is not None)
+
+
+class ExportService:
+    """
+    Builds exports in a pool of worker processes so large PDF/DOCX files neither block the
+    Streamlit script thread nor hold the GIL. Jobs are identified by their cache key, so
+    identical requests share one build, and at most queue_size builds are admitted at once.
+    """
+
+    def __init__(self, workers: int = EXPORT_WORKERS, queue_size: int = EXPORT_QUEUE_SIZE, cache: ExportCache = export_cache):
+        self.workers = workers
+        self.cache = cache
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drop a pool whose worker died so the next job starts a fresh one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self, fmt: str, text: str, title: str) -> Future:
+        if self.workers <= 0:
+            future = Future()
+            future.set_result(build_export(fmt, text, title))
+            return future
+        pool = self._executor()
+        try:
+            return pool.submit(build_export, fmt, text, title)
+        except BrokenProcessPool:
+            print("⚠️ Export worker died, restarting the export pool")
+            self._discard_pool(pool)
+            return self._executor().submit(build_export, fmt, text, title)
+
+    def _expire(self):
+        """Forget finished jobs nobody came back for; call with self._lock held"""
+        cutoff = time.monotonic() - EXPORT_JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.future.done() and job.submitted_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _join(self, job_id: str, future: Future) -> str:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.failed():
+                job.waiters += 1  # another caller won the race; share its job
+            else:
+                self._jobs[job_id] = _Job(future)
+        return job_id
+
+    def submit(self, fmt: str, text: str, title: str, timeout: float = EXPORT_SUBMIT_TIMEOUT) -> str:
+        """
+        Queue an export and return its job id. Raises ExportQueueFull when no slot frees up
+        within timeout.
+        """
+        job_id = ":".join(export_key(fmt, text, title))
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is not None and not job.failed():
+                job.waiters += 1
+                return job_id
+        data = self.cache.get(fmt, text, title)
+        if data is not None:
+            future = Future()
+            future.set_result(data)
+            return self._join(job_id, future)
+
+        if not self._slots.acquire(timeout=timeout):
+            raise ExportQueueFull(f"❌ Export queue is full ({fmt}).")
+        try:
+            future = self._start(fmt, text, title)
+        except Exception:
+            self._slots.release()
+            raise
+
+        def finished(done):
+            self._slots.release()
+            if not done.cancelled() and done.exception() is None:
+                self.cache.put(fmt, text, title, done.result())
+
+        future.add_done_callback(finished)
+        return self._join(job_id, future)
+
+    def status(self, job_id: str) -> str:
+        """One of 'unknown', 'running', 'done' or 'failed'"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return "unknown"
+        if not job.future.done():
+            return "running"
+        return "failed" if job.failed() else "done"
+
+    def result(self, job_id: str, timeout: float = EXPORT_TIMEOUT) -> bytes:
+        """
+        Wait for a job and return its bytes. Each submit is matched by one result call; the
+        job is forgotten once its last caller has collected it or given up waiting. A build
+        that outlives its callers still lands in the cache.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        try:
+            return job.future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                job.waiters -= 1
+                if job.waiters <= 0 and self._jobs.get(job_id) is job:
+                    del self._jobs[job_id]
+
+    def stream(self, job_id: str, chunk_size: int = EXPORT_CHUNK_SIZE, timeout: float = EXPORT_TIMEOUT):
+        """Yield the finished file in chunks"""
+        data = memoryview(self.result(job_id, timeout=timeout))
+        for start in range(0, len(data), chunk_size):
+            yield bytes(data[start:start + chunk_size])
+
+    def build(self, fmt: str, text: str, title: str, timeout: float = EXPORT_TIMEOUT) -> bytes:
+        with span(f"export.{fmt}", chars=len(text)):
+            return self.result(self.submit(fmt, text, title), timeout=timeout)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+export_service = ExportService()
@@ -1,67 +1,143 @@
 import os
-import json
-from azure.storage.blob import BlobServiceClient
+from blobclients import get_blob_client
+import time
+import threading
+from collections import OrderedDict
+from azure.core.exceptions import ResourceNotFoundError
+from lessoncache import lesson_cache
+from corpuspack import get_lesson_pack, LESSON_CONTAINER
+from htmltext import html_to_text, html_to_text_many
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
 import re
 load_dotenv()
 
+FORMATTED_LESSON_CACHE_ENTRIES = int(os.getenv("FORMATTED_LESSON_CACHE_ENTRIES", "128"))
+# With a lesson pack configured, treat it as the full corpus and never fall back to blob storage.
+LESSON_PACK_STRICT = os.getenv("LESSON_PACK_STRICT", "true").lower() in ("1", "true", "yes")
+MISSING_LESSON_TTL = float(os.getenv("MISSING_LESSON_TTL", "600"))
+MISSING_LESSON_ENTRIES = int(os.getenv("MISSING_LESSON_ENTRIES", "4096"))
+
+_formatted_lessons = OrderedDict()
+_formatted_lessons_lock = threading.Lock()
+# blob_path -> time until which the blob is known not to exist
+_missing_lessons = OrderedDict()
+_missing_lessons_lock = threading.Lock()
+
 def clean_html(html_text):
-    if not html_text:
-        return ""
-    soup = BeautifulSoup(html_text, "html.parser")
-    return soup.get_text(separator="\n", strip=True)
+    return html_to_text(html_text)
+
+def lesson_blob_path(benchmark: str, resource_id: str) -> str:
+    return f"lessonplans/{benchmark}/{resource_id}.json"
+
+def lesson_etag(benchmark: str, resource_id: str):
+    """ETag of the packed or cached lesson blob, used to key the formatted output; None if unknown"""
+    pack = get_lesson_pack()
+    etag = pack.etag(benchmark, resource_id) if pack is not None else None
+    return etag or lesson_cache.etag(lesson_blob_path(benchmark, resource_id))
+
+def _known_missing(blob_path: str) -> bool:
+    with _missing_lessons_lock:
+        expires = _missing_lessons.get(blob_path)
+        if expires is None:
+            return False
+        if expires < time.time():
+            del _missing_lessons[blob_path]
+            return False
+        return True
+
+def _remember_missing(blob_path: str):
+    with _missing_lessons_lock:
+        _missing_lessons[blob_path] = time.time() + MISSING_LESSON_TTL
+        _missing_lessons.move_to_end(blob_path)
+        while len(_missing_lessons) > MISSING_LESSON_ENTRIES:
+            _missing_lessons.popitem(last=False)
 
 def get_blob_data(benchmark: str, resource_id: str):
     connect_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
     if not connect_str:
         raise ValueError("❌ AZURE_STORAGE_CONNECTION_STRING not found in environment.")
 
-    container_name = "cpalmsnewdata"
-    blob_path = f"lessonplans/{benchmark}/{resource_id}.json"
+    blob_path = lesson_blob_path(benchmark, resource_id)
+    if _known_missing(blob_path):
+        return None
 
-    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_path)
+    blob_client = get_blob_client(LESSON_CONTAINER, blob_path, connect_str)
 
     try:
-        blob_data = blob_client.download_blob().readall()
-        json_data = json.loads(blob_data)
-        return json_data
+        return lesson_cache.get_json(blob_path, blob_client)
+    except ResourceNotFoundError:
+        _remember_missing(blob_path)
+        print(f"⚠️ Lesson blob not found: {blob_path}")
+        return None
     except Exception as e:
         print(f"❌ Failed to retrieve blob: {e}")
         return None
 
-def format_lesson_output(data: dict,attachments_hyperlinks: list) -> str:
-    def section(label, value):
-        return f"**{label}:** {clean_html(str(value))}" if value else ""
+def format_lesson_output(data: dict,attachments_hyperlinks: list, etag: str = None) -> str:
+    """
+    Markdown view of a lesson. Every HTML field goes through one html_to_text_many call,
+    and when the blob's etag is known the result is kept per (ResourceId, etag, attachments).
+    """
+    resource_id = data.get("ResourceId")
+    key = (resource_id, etag, attachments_hyperlinks) if etag and resource_id else None
+    if key is not None:
+        with _formatted_lessons_lock:
+            cached = _formatted_lessons.get(key)
+            if cached is not None:
+                _formatted_lessons.move_to_end(key)
+                return cached
+
+    sections = [
+        ("Title", data.get("Title")),
+        ("Grade Level", data.get("GradeLevelNames")),
+        ("Subject Areas", data.get("SubjectAreaNames")),
+        ("Audience", data.get("IntendedAudienceNames")),
+        ("Benchmarks", data.get("BenchmarkCodes")),
+        ("Description", data.get("Description")),
+    ]
+    questions = data.get("LessonPlanQuestions", [])
+    fields = [str(value) if value else "" for _, value in sections]
+    for q in questions:
+        fields.append(q.get("Title", "") or "")
+        fields.append(q.get("ResLessPlanQuestionAnswer", "") or "")
+    texts = html_to_text_many(fields)
 
     output = []
 
-   
-    resource_id = data.get("ResourceId")
     if resource_id:
         resource_link = f'<a href="https://www.cpalms.org/Public/PreviewResourceLesson/Preview/{resource_id}" target="_blank">{resource_id}</a>'
         output.append(f"**ResourceId:** {resource_link}")
-    output.append(section("Title", data.get("Title")))
-    output.append(section("Grade Level", data.get("GradeLevelNames")))
-    output.append(section("Subject Areas", data.get("SubjectAreaNames")))
-    output.append(section("Audience", data.get("IntendedAudienceNames")))
-    output.append(section("Benchmarks", data.get("BenchmarkCodes")))
-    output.append(section("Description", data.get("Description")))
+    for (label, value), text in zip(sections, texts):
+        output.append(f"**{label}:** {text}" if value else "")
     if attachments_hyperlinks.strip():
         output.append("**Attachments:**")
         output.append(attachments_hyperlinks)
-    questions = data.get("LessonPlanQuestions", [])
-    for q in questions:
-        title = clean_html(q.get("Title", ""))
-        answer = clean_html(q.get("ResLessPlanQuestionAnswer", ""))
+    question_texts = texts[len(sections):]
+    for title, answer in zip(question_texts[0::2], question_texts[1::2]):
         if title and answer:
             output.append(f"### {title}")
             output.append(answer)
 
-    return "\n\n".join(output)        
+    formatted = "\n\n".join(output)
+    if key is not None:
+        with _formatted_lessons_lock:
+            _formatted_lessons[key] = formatted
+            while len(_formatted_lessons) > FORMATTED_LESSON_CACHE_ENTRIES:
+                _formatted_lessons.popitem(last=False)
+    return formatted
 
 def fetch_and_get_lesson(benchmark: str, resource_id: str):
+    pack = get_lesson_pack()
+    if pack is not None:
+        blob_data = pack.get_json(benchmark, resource_id)
+        if blob_data is not None:
+            return blob_data
+        if LESSON_PACK_STRICT:
+            benchmarks = pack.benchmarks_for(resource_id)
+            if benchmarks:
+                return f"⚠️ Resource ID '{resource_id}' is not listed under Benchmark '{benchmark}'. It is listed under: {', '.join(benchmarks)}."
+            return f"⚠️ No lesson plan found for Resource ID '{resource_id}' under Benchmark '{benchmark}'. Please check if the ID is correct and try again."
+
     blob_data = get_blob_data(benchmark, resource_id)
     if blob_data is None:
         return f"⚠️ No lesson plan found for Resource ID '{resource_id}' under Benchmark '{benchmark}'. Please check if the ID is correct and try again."
@@ -0,0 +1,169 @@
+"""
+HTML-to-text for lesson fields, equivalent to BeautifulSoup(html, "html.parser").get_text("\\n", strip=True):
+every text node stripped, empty ones dropped, the rest joined with newlines, and script/style
+content left out.
+
+The backend is chosen by HTML_TEXT_BACKEND: selectolax (lexbor) or lxml when installed, with
+the stdlib html.parser as the always-available fallback. The stdlib backend matches bs4
+exactly. The two C parsers follow HTML5: line endings become "\\n", stray end tags are
+ignored and implied ones (a <p> or <li> opened inside another) are added, so badly nested
+markup can merge text that html.parser would split. Set HTML_TEXT_BACKEND=stdlib where that
+matters more than speed.
+"""
+import os
+import re
+from html.parser import HTMLParser
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTML_TEXT_BACKEND = os.getenv("HTML_TEXT_BACKEND", "auto").lower()
+
+_SKIPPED_TAGS = ("script", "style", "template")
+# Placed between fields when a whole lesson is parsed as one document; a private-use
+# character, since str.strip() treats the ASCII separators as whitespace.
+_FIELD_BREAK = "\ue000"
+# Markup that can swallow or move a break marker: comments and declarations, raw-text and
+# RCDATA elements, tables (foster parenting) and foreign content.
+_UNSAFE_TO_JOIN = re.compile(
+    r"<(?:!|/?(?:script|style|template|title|textarea|xmp|plaintext|iframe|noembed|noframes|noscript"
+    r"|select|svg|math|frameset|table|caption|colgroup|col|tbody|thead|tfoot|tr|td|th)\b)",
+    re.IGNORECASE
+)
+
+
+class _TextCollector(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._pending = []
+        self._skip = 0
+
+    def _flush(self):
+        if self._pending:
+            text = "".join(self._pending).strip()
+            self._pending = []
+            if text and not self._skip:
+                self.parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in _SKIPPED_TAGS:
+            self._skip += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in _SKIPPED_TAGS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        self._pending.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.startswith("CDATA["):
+            self._pending.append(data[6:])
+            self._flush()
+
+    def text(self, html: str) -> str:
+        self.reset()
+        self.parts = []
+        self._pending = []
+        self._skip = 0
+        self.feed(html)
+        self.close()
+        self._flush()
+        return "\n".join(self.parts)
+
+
+def _stdlib_many(htmls: list) -> list:
+    collector = _TextCollector()
+    return [collector.text(html) for html in htmls]
+
+
+def _join_stripped(texts) -> str:
+    return "\n".join(text for text in (text.strip() for text in texts) if text)
+
+
+def _selectolax_text(html: str) -> str:
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(_SKIPPED_TAGS))
+    if tree.root is None:
+        return ""
+    # Node.text(strip=True) keeps empty strings for whitespace-only nodes, so strip per node here.
+    return _join_stripped(node.text_content for node in tree.root.traverse(include_text=True) if node.tag == "-text")
+
+
+def _lxml_text(html: str) -> str:
+    try:
+        root = lxml.html.fragment_fromstring(html, create_parent="div")
+    except (ValueError, lxml.etree.ParserError):
+        return ""
+    lxml.etree.strip_elements(root, *_SKIPPED_TAGS, with_tail=False)
+    return _join_stripped(root.itertext())
+
+
+def _tree_many(text_of):
+    """
+    Parse all fields as one document with a break marker between them, which is several
+    times faster than one parse per field. Fields with markup that could swallow or move a
+    marker are parsed one by one instead, as is everything if a marker still goes missing.
+    """
+    def many(htmls: list) -> list:
+        if len(htmls) > 1 and not any(_UNSAFE_TO_JOIN.search(html) for html in htmls):
+            joined = f"<br>{_FIELD_BREAK}<br>".join(html.replace(_FIELD_BREAK, "") for html in htmls)
+            fields = text_of(joined).split(_FIELD_BREAK)
+            if len(fields) == len(htmls):
+                # Only the newlines joining a field to the markers; text nodes are already stripped.
+                return [field.strip("\n") for field in fields]
+        return [text_of(html) for html in htmls]
+    return many
+
+
+_backends = {"stdlib": _stdlib_many}
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    _backends["selectolax"] = _tree_many(_selectolax_text)
+except ImportError:
+    pass
+try:
+    import lxml.html
+    import lxml.etree
+    _backends["lxml"] = _tree_many(_lxml_text)
+except ImportError:
+    pass
+
+if HTML_TEXT_BACKEND in _backends:
+    backend_name = HTML_TEXT_BACKEND
+else:
+    if HTML_TEXT_BACKEND != "auto":
+        print(f"⚠️ HTML_TEXT_BACKEND '{HTML_TEXT_BACKEND}' is not available, choosing automatically.")
+    backend_name = next(name for name in ("selectolax", "lxml", "stdlib") if name in _backends)
+_many = _backends[backend_name]
+
+
+def html_to_text_many(htmls: list) -> list:
+    """Text of each HTML string, parsed together where the backend allows it"""
+    results = [""] * len(htmls)
+    present = [i for i, html in enumerate(htmls) if html]
+    for i, text in zip(present, _many([htmls[i] for i in present])):
+        results[i] = text
+    return results
+
+
+def html_to_text(html: str) -> str:
+    if not html:
+        return ""
+    return _many([html])[0]
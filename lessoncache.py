@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LESSON_CACHE_MAX_BYTES = int(os.getenv("LESSON_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LESSON_CACHE_TTL = float(os.getenv("LESSON_CACHE_TTL", "300"))
+LESSON_CACHE_DIR = os.getenv("LESSON_CACHE_DIR", "")
+
+
+class CacheEntry:
+    __slots__ = ("data", "etag", "last_modified", "validated_at", "_parsed")
+
+    def __init__(self, data: bytes, etag: str, last_modified: str, validated_at: float):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.validated_at = validated_at
+        self._parsed = None
+
+    def json(self):
+        if self._parsed is None:
+            self._parsed = json.loads(self.data)
+        return self._parsed
+
+
+class LessonCache:
+    """
+    Two-tier cache for lesson plan blobs: an in-memory LRU bounded by payload bytes,
+    backed by an optional directory on disk. Entries older than the TTL are revalidated
+    against the blob ETag with a conditional GET instead of being downloaded again.
+    """
+
+    def __init__(self, max_bytes: int = LESSON_CACHE_MAX_BYTES, ttl: float = LESSON_CACHE_TTL, cache_dir: str = LESSON_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "not_modified": 0, "refreshed": 0, "evictions": 0}
+
+    def get_json(self, blob_path: str, blob_client):
+        """Return the parsed JSON for blob_path, downloading only when it is missing or changed"""
+        entry = self._get_memory(blob_path)
+        if entry is None:
+            entry = self._load_disk(blob_path)
+            if entry is not None:
+                self._count("disk_hits")
+                self._put_memory(blob_path, entry)
+
+        if entry is not None and time.time() - entry.validated_at < self.ttl:
+            self._count("hits")
+            return entry.json()
+
+        if entry is not None:
+            try:
+                downloader = blob_client.download_blob(etag=entry.etag, match_condition=MatchConditions.IfModified)
+            except ResourceNotModifiedError:
+                self._count("not_modified")
+                entry.validated_at = time.time()
+                self._write_disk_meta(blob_path, entry)
+                return entry.json()
+            self._count("refreshed")
+        else:
+            self._count("misses")
+            downloader = blob_client.download_blob()
+
+        data = downloader.readall()
+        properties = downloader.properties
+        last_modified = properties.last_modified.isoformat() if properties.last_modified else ""
+        entry = CacheEntry(data, properties.etag, last_modified, time.time())
+        parsed = entry.json()
+        self._put_memory(blob_path, entry)
+        self._write_disk(blob_path, entry)
+        return parsed
+
+    def store(self, blob_path: str, data: bytes, etag: str, last_modified: str) -> bool:
+        """
+        Save a freshly downloaded blob to disk, refreshing the in-memory copy if there is one.
+        Returns False when the disk write failed.
+        """
+        entry = CacheEntry(data, etag, last_modified, time.time())
+        written = self._write_disk(blob_path, entry)
+        with self._lock:
+            held = blob_path in self._entries
+        if held:
+            self._put_memory(blob_path, entry)
+        return written
+
+    def discard(self, blob_path: str):
+        """Forget a blob that no longer exists, in memory and on disk"""
+        with self._lock:
+            entry = self._entries.pop(blob_path, None)
+            if entry is not None:
+                self._size -= len(entry.data)
+        if self.cache_dir:
+            path = self._disk_path(blob_path)
+            for stale in (path, path + ".meta.json"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"❌ Failed to remove lesson cache file: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+    def etag(self, blob_path: str):
+        """ETag of the copy held in memory, or None"""
+        with self._lock:
+            entry = self._entries.get(blob_path)
+            return entry.etag if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _get_memory(self, blob_path: str):
+        with self._lock:
+            entry = self._entries.get(blob_path)
+            if entry is not None:
+                self._entries.move_to_end(blob_path)
+            return entry
+
+    def _put_memory(self, blob_path: str, entry: CacheEntry):
+        size = len(entry.data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(blob_path, None)
+            if previous is not None:
+                self._size -= len(previous.data)
+            self._entries[blob_path] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.data)
+                self.counters["evictions"] += 1
+
+    def _disk_path(self, blob_path: str) -> str:
+        return os.path.join(self.cache_dir, *blob_path.split("/"))
+
+    def _load_disk(self, blob_path: str):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(blob_path)
+        try:
+            with open(path + ".meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(path, "rb") as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(data, meta.get("etag"), meta.get("last_modified", ""), meta.get("validated_at", 0.0))
+
+    def _write_disk(self, blob_path: str, entry: CacheEntry) -> bool:
+        if not self.cache_dir:
+            return True
+        path = self._disk_path(blob_path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, entry.data)
+        except OSError as e:
+            print(f"❌ Failed to write lesson cache file: {e}")
+            return False
+        return self._write_disk_meta(blob_path, entry)
+
+    def _write_disk_meta(self, blob_path: str, entry: CacheEntry) -> bool:
+        if not self.cache_dir:
+            return True
+        meta = {"etag": entry.etag, "last_modified": entry.last_modified, "validated_at": entry.validated_at}
+        try:
+            _atomic_write(self._disk_path(blob_path) + ".meta.json", json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            print(f"❌ Failed to write lesson cache metadata: {e}")
+            return False
+        return True
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+lesson_cache = LessonCache()
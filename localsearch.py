@@ -0,0 +1,335 @@
+"""
+Local stand-in for the attachment chunk index, for offline runs and to skip the Azure
+Search round trip.
+
+    python localsearch.py build --out ./attachment_index
+    python localsearch.py build --jsonl chunks.jsonl --out ./attachment_index
+    python localsearch.py query ./attachment_index 123456
+
+The index directory holds the documents as JSON lines, BM25 postings over the chunk and
+metadata_storage_path (both searchable in Azure, so a resource id in search_text matches
+its attachments), an inverted index from resource ids in the path to documents, and
+optionally one unit vector
+per document. The arrays are NumPy files opened with mmap_mode="r", so worker processes
+share them through the page cache. LocalSearchIndex.search takes the same arguments as
+SearchClient.search for what retrieval.py uses: search_text, filter, select, top and
+vector_queries. Filters are the OData subset retrieval.py builds: search.ismatch(...) and
+"field eq 'value'" clauses joined with "and". Anything else raises HttpResponseError like
+the service would, so callers' fallbacks still apply.
+"""
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import shutil
+import argparse
+import numpy as np
+from azure.core.exceptions import HttpResponseError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "azure" queries AZURE_SEARCH_INDEX_1; "local" reads the index in LOCAL_SEARCH_DIR.
+ATTACHMENT_SEARCH_BACKEND = os.getenv("ATTACHMENT_SEARCH_BACKEND", "azure").lower()
+LOCAL_SEARCH_DIR = os.getenv("LOCAL_SEARCH_DIR", "attachment_index")
+# Azure Search's BM25 defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal rank fusion constant for hybrid (text + vector) queries, as Azure uses.
+RRF_K = 60
+TEXT_FIELD = "chunk"
+PATH_FIELD = "metadata_storage_path"
+SEARCHABLE_FIELDS = (TEXT_FIELD, PATH_FIELD)
+
+_TOKEN = re.compile(r"\w+")
+_ISMATCH = re.compile(r"search\.ismatch\(\s*'((?:[^']|'')*)'\s*(?:,\s*'((?:[^']|'')*)'\s*)?(?:,[^)]*)?\)", re.IGNORECASE)
+_EQ = re.compile(r"(\w+)\s+eq\s+'((?:[^']|'')*)'", re.IGNORECASE)
+_AND = re.compile(r"\s+and\s+", re.IGNORECASE)
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _resource_keys(path: str) -> set:
+    return {token for token in tokenize(path) if token.isdigit()}
+
+
+def _unquote(literal: str) -> str:
+    return literal.replace("''", "'")
+
+
+def _contains_phrase(tokens: list, phrase: list) -> bool:
+    if not phrase:
+        return True
+    width = len(phrase)
+    return any(tokens[i:i + width] == phrase for i in range(len(tokens) - width + 1))
+
+
+class LocalSearchIndex:
+    def __init__(self, index_dir: str = LOCAL_SEARCH_DIR):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.count = meta["count"]
+        self.vector_field = meta.get("vector_field")
+        if tuple(meta.get("searchable_fields", (TEXT_FIELD,))) != SEARCHABLE_FIELDS:
+            print(f"⚠️ Local search index in {index_dir} predates path search; rebuild it so resource ids in search_text match.")
+        with open(os.path.join(index_dir, "terms.json"), "r", encoding="utf-8") as f:
+            self._terms = json.load(f)
+        with open(os.path.join(index_dir, "resources.json"), "r", encoding="utf-8") as f:
+            self._resources = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self._offsets = load("doc_offsets.npy")
+        self._post_docs = load("postings_docs.npy")
+        self._post_tf = load("postings_tf.npy")
+        doc_len = np.asarray(load("doc_len.npy"), dtype=np.float32)
+        avg_len = float(doc_len.mean()) if self.count else 1.0
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / max(avg_len, 1.0))
+        vectors_path = os.path.join(index_dir, "vectors.npy")
+        self._vectors = load("vectors.npy") if os.path.exists(vectors_path) else None
+        with open(os.path.join(index_dir, "documents.jsonl"), "rb") as f:
+            self._documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+
+    def document(self, i: int) -> dict:
+        return json.loads(self._documents[int(self._offsets[i]):int(self._offsets[i + 1])])
+
+    def _filter(self, expression: str):
+        """Ids of documents passing the filter, or None for no filter"""
+        if not expression:
+            return None
+        candidates = None
+        for clause in _AND.split(expression.strip()):
+            clause = clause.strip()
+            while clause.startswith("(") and clause.endswith(")"):
+                clause = clause[1:-1].strip()
+            ismatch = _ISMATCH.fullmatch(clause)
+            eq = _EQ.fullmatch(clause)
+            if ismatch:
+                ids = self._ismatch(_unquote(ismatch.group(1)), _unquote(ismatch.group(2) or TEXT_FIELD), candidates)
+            elif eq:
+                field, value = eq.group(1), _unquote(eq.group(2))
+                pool = range(self.count) if candidates is None else candidates
+                ids = np.array([i for i in pool if str(self.document(i).get(field)) == value], dtype=np.int64)
+            else:
+                raise HttpResponseError(message=f"Unsupported filter for the local index: {clause}")
+            candidates = ids
+        return candidates
+
+    def _ismatch(self, query: str, field: str, candidates):
+        quoted = len(query) > 1 and query[0] == query[-1] == '"'
+        phrases = [tokenize(part.strip().strip('"')) for part in query.split("|")]
+        phrases = [phrase for phrase in phrases if phrase]
+        if field == PATH_FIELD and quoted and len(phrases) == 1 and len(phrases[0]) == 1 and phrases[0][0].isdigit():
+            ids = np.array(self._resources.get(phrases[0][0], []), dtype=np.int64)
+            return ids if candidates is None else np.intersect1d(ids, candidates)
+        pool = range(self.count) if candidates is None else candidates
+        matched = []
+        for i in pool:
+            tokens = tokenize(str(self.document(i).get(field, "")))
+            if quoted or "|" in query:
+                hit = any(_contains_phrase(tokens, phrase) for phrase in phrases)
+            else:
+                hit = bool(set(tokens) & {token for phrase in phrases for token in phrase})
+            if hit:
+                matched.append(i)
+        return np.array(matched, dtype=np.int64)
+
+    def _bm25(self, text: str) -> np.ndarray:
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(text)):
+            bounds = self._terms.get(term)
+            if bounds is None:
+                continue
+            start, end = bounds
+            docs = self._post_docs[start:end]
+            tf = self._post_tf[start:end].astype(np.float32)
+            idf = math.log(1 + (self.count - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def _cosine(self, vector) -> np.ndarray:
+        if self._vectors is None:
+            raise HttpResponseError(message="The local index was built without vectors")
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return np.asarray(self._vectors @ (query / norm if norm else query))
+
+    @staticmethod
+    def _ranked(scores: np.ndarray, ids: np.ndarray, limit: int):
+        """The best limit ids and their scores, best first"""
+        if limit < len(ids):
+            part = np.argpartition(-scores, limit)[:limit]
+            ids, scores = ids[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+    def search(self, search_text: str = None, filter: str = None, select=None, top: int = None,
+               vector_queries=None, **kwargs):
+        """Documents as dicts with "@search.score", best first, like SearchClient.search"""
+        candidates = self._filter(filter)
+        ids = np.arange(self.count, dtype=np.int64) if candidates is None else np.asarray(candidates, dtype=np.int64)
+        limit = len(ids) if top is None else min(top, len(ids))
+        text = "" if search_text in (None, "*") else search_text
+
+        rankings = []
+        if text:
+            scores = self._bm25(text)[ids]
+            keep = scores > 0
+            rankings.append(self._ranked(scores[keep], ids[keep], limit))
+        for vector_query in vector_queries or []:
+            k = min(getattr(vector_query, "k_nearest_neighbors", None) or limit, len(ids))
+            rankings.append(self._ranked(self._cosine(vector_query.vector)[ids], ids, k))
+
+        if not rankings:
+            results = [(int(i), 1.0) for i in ids[:limit]]
+        elif len(rankings) == 1:
+            order, scores = rankings[0]
+            results = [(int(i), float(score)) for i, score in zip(order[:limit], scores[:limit])]
+        else:
+            fused = {}
+            for order, _ in rankings:
+                for rank, i in enumerate(order):
+                    fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (RRF_K + rank + 1)
+            results = sorted(fused.items(), key=lambda item: -item[1])[:limit]
+
+        return self._documents_for(results, select)
+
+    def _documents_for(self, results: list, select):
+        for i, score in results:
+            doc = self.document(i)
+            if select:
+                doc = {field: doc.get(field) for field in select}
+            doc["@search.score"] = score
+            yield doc
+
+
+def build_index(documents, out_dir: str, vector_field: str = None) -> dict:
+    """Write an index for documents (dicts with chunk, metadata_storage_path and optionally vector_field)"""
+    tmp_dir = f"{out_dir.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    postings = {}
+    resources = {}
+    doc_len = []
+    offsets = [0]
+    vectors = []
+    with open(os.path.join(tmp_dir, "documents.jsonl"), "wb") as f:
+        for i, doc in enumerate(documents):
+            vector = doc.get(vector_field) if vector_field else None
+            stored = {TEXT_FIELD: doc.get(TEXT_FIELD) or "", PATH_FIELD: doc.get(PATH_FIELD) or ""}
+            data = json.dumps(stored, ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+            tokens = [token for field in SEARCHABLE_FIELDS for token in tokenize(stored[field])]
+            doc_len.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((i, tf))
+            for key in _resource_keys(stored[PATH_FIELD]):
+                resources.setdefault(key, []).append(i)
+            if vector_field:
+                vectors.append(vector)
+
+    terms = {}
+    post_docs = []
+    post_tf = []
+    for term in sorted(postings):
+        start = len(post_docs)
+        for i, tf in postings[term]:
+            post_docs.append(i)
+            post_tf.append(min(tf, 65535))
+        terms[term] = [start, len(post_docs)]
+
+    count = len(doc_len)
+    np.save(os.path.join(tmp_dir, "doc_offsets.npy"), np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, "doc_len.npy"), np.array(doc_len, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "postings_docs.npy"), np.array(post_docs, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "postings_tf.npy"), np.array(post_tf, dtype=np.uint16))
+    dimensions = 0
+    if vector_field:
+        dimensions = max((len(v) for v in vectors if v), default=0)
+        matrix = np.zeros((count, dimensions), dtype=np.float32)
+        for i, vector in enumerate(vectors):
+            if vector:
+                matrix[i] = vector
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), matrix)
+    with open(os.path.join(tmp_dir, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f)
+    with open(os.path.join(tmp_dir, "resources.json"), "w", encoding="utf-8") as f:
+        json.dump(resources, f)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": count, "vector_field": vector_field if dimensions else None, "dimensions": dimensions,
+                   "searchable_fields": list(SEARCHABLE_FIELDS)}, f)
+
+    # Swap the finished directory in; readers holding the old files keep their mappings.
+    old_dir = f"{out_dir.rstrip(os.sep)}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return {"documents": count, "terms": len(terms), "resources": len(resources), "dimensions": dimensions}
+
+
+def azure_documents(vector_field: str = None):
+    """Every document in AZURE_SEARCH_INDEX_1"""
+    from azure.search.documents import SearchClient
+    from azure.core.credentials import AzureKeyCredential
+    client = SearchClient(
+        endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
+        index_name=os.getenv("AZURE_SEARCH_INDEX_1"),
+        credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_KEY")),
+    )
+    select = [TEXT_FIELD, PATH_FIELD] + ([vector_field] if vector_field else [])
+    yield from client.search(search_text="*", select=select)
+
+
+def jsonl_documents(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the local attachment chunk index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="export the Azure attachment index into a local one")
+    build.add_argument("--out", default=LOCAL_SEARCH_DIR, help="index directory to write")
+    build.add_argument("--jsonl", help="read documents from a JSON lines file instead of Azure Search")
+    build.add_argument("--vector-field", help="document field holding an embedding to index for vector queries")
+    query = commands.add_parser("query", help="show the chunks the app would get for a resource id")
+    query.add_argument("index_dir", nargs="?", default=LOCAL_SEARCH_DIR)
+    query.add_argument("resource_id")
+    query.add_argument("--text", default="*", help="search text ranked with BM25")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        documents = jsonl_documents(args.jsonl) if args.jsonl else azure_documents(args.vector_field)
+        stats = build_index(documents, args.out, args.vector_field)
+        print(f"✅ Indexed {stats['documents']} chunks, {stats['terms']} terms, {stats['resources']} resource ids"
+              + (f", {stats['dimensions']}-d vectors" if stats["dimensions"] else "") + f" into {args.out}")
+    else:
+        index = LocalSearchIndex(args.index_dir)
+        results = index.search(
+            search_text=args.text,
+            filter=f"search.ismatch('\"{args.resource_id}\"', '{PATH_FIELD}')",
+            select=[PATH_FIELD, TEXT_FIELD],
+        )
+        for doc in results:
+            json.dump({**doc, TEXT_FIELD: doc[TEXT_FIELD][:200]}, sys.stdout, ensure_ascii=False)
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,193 @@
-from azure.storage.blob import BlobServiceClient, BlobType
+from blobclients import get_blob_client
 from datetime import datetime
-from dataformatting import convert_markdown_to_clean_text
+from rendercache import render
+from artifactstore import remove_artifact_links
+from contextpacking import count_tokens
+from collections import OrderedDict
 import os
+import json
+import hashlib
+import time
+import queue
+import atexit
+import threading
 from dotenv import load_dotenv
-import re
 
 load_dotenv()
 
-def remove_inline_download_links(text: str) -> str:
-    return re.sub(
-        r'📄.*?\(data:application\/vnd\.openxmlformats-officedocument\.wordprocessingml\.document;base64,[^)]+\)',
-        '', 
-        text
-    )
+# Azure caps a single append_block call at 4 MiB.
+APPEND_BLOCK_LIMIT = 4 * 1024 * 1024
+LOG_BATCH_MAX_BYTES = min(int(os.getenv("LOG_BATCH_MAX_BYTES", str(APPEND_BLOCK_LIMIT))), APPEND_BLOCK_LIMIT)
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+# Number of users whose last dedup key is remembered.
+LOG_DEDUP_KEYS = int(os.getenv("LOG_DEDUP_KEYS", "1024"))
+LOG_SHUTDOWN_TIMEOUT = float(os.getenv("LOG_SHUTDOWN_TIMEOUT", "10"))
+LOG_BLOB_PREFIX = "lesson_logs_"
 
-def log_query_to_blob(container_name, resource_id, benchmark_code, benchmark_id, query,processing_time, lesson_plan, ai_output):
+_STOP = object()
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(" ".join(query.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def format_log_entry(record: dict) -> str:
+    """One JSON line per request; the Markdown is cleaned and completion tokens counted here, off the script thread"""
+    entry = dict(record)
+    ai_output = render(remove_artifact_links, entry.pop("ai_output"))
+    tokens = dict(entry.get("tokens") or {})
+    tokens.setdefault("completion", count_tokens(ai_output))
+    entry["tokens"] = tokens
+    entry["lesson_plan"] = render("clean_text", entry.pop("lesson_plan"))
+    entry["ai_output"] = render("clean_text", ai_output)
+    return json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+
+class LogShipper:
+    """
+    Ships log entries to daily append blobs from a background thread. Entries are formatted
+    off the Streamlit script thread, grouped per blob, and appended in batches of up to
+    LOG_BATCH_MAX_BYTES once a batch is full or LOG_FLUSH_INTERVAL has passed. Each blob's
+    existence is checked once per process, and an entry repeating its user's previous dedup key
+    is dropped.
+    """
+
+    def __init__(self, container_name: str, connection_string: str, formatter=format_log_entry,
+                 batch_max_bytes: int = LOG_BATCH_MAX_BYTES, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.container_name = container_name
+        self.connection_string = connection_string
+        self.formatter = formatter
+        self.batch_max_bytes = batch_max_bytes
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._last_keys = OrderedDict()
+        self._keys_lock = threading.Lock()
+        self._ready_blobs = set()
+        self._thread = threading.Thread(target=self._run, name=f"log-shipper-{container_name}", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, blob_name: str, record: dict, dedup_key: str = None) -> bool:
+        """
+        Queue a record for blob_name; returns False if it was a duplicate or the queue is full.
+        dedup_key is "<user>:<key>"; a record is a duplicate only when its key is the one last
+        enqueued for the same user, so asking A, B, then A again logs all three.
+        """
+        if dedup_key is not None:
+            user, _, key = dedup_key.partition(":")
+            with self._keys_lock:
+                if self._last_keys.get(user) == key:
+                    self._last_keys.move_to_end(user)
+                    return False
+                self._last_keys[user] = key
+                self._last_keys.move_to_end(user)
+                while len(self._last_keys) > LOG_DEDUP_KEYS:
+                    self._last_keys.popitem(last=False)
+        try:
+            self._queue.put_nowait((blob_name, record))
+        except queue.Full:
+            print("⚠️ Log queue is full, dropping entry.")
+            return False
+        return True
+
+    def close(self, timeout: float = LOG_SHUTDOWN_TIMEOUT):
+        """Flush everything still queued and stop the worker"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        batches = {}
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batches)
+                return
+            if item is not None:
+                blob_name, record = item
+                try:
+                    data = self.formatter(record).encode("utf-8")
+                except Exception as e:
+                    print(f"❌ Error formatting log entry: {e}")
+                    continue
+                if size + len(data) > self.batch_max_bytes:
+                    self._flush(batches)
+                    batches, size = {}, 0
+                batches.setdefault(blob_name, []).append(data)
+                size += len(data)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batches and (item is None or size >= self.batch_max_bytes):
+                self._flush(batches)
+                batches, size, deadline = {}, 0, None
+
+    def _flush(self, batches: dict):
+        for blob_name, entries in batches.items():
+            data = b"".join(entries)
+            try:
+                blob_client = get_blob_client(self.container_name, blob_name, self.connection_string)
+                if blob_name not in self._ready_blobs:
+                    if not blob_client.exists():
+                        blob_client.create_append_blob()
+                    self._ready_blobs.add(blob_name)
+                for start in range(0, len(data), APPEND_BLOCK_LIMIT):
+                    blob_client.append_block(data[start:start + APPEND_BLOCK_LIMIT])
+                print(f"✅ {len(entries)} log entr{'y' if len(entries) == 1 else 'ies'} appended to {blob_name}.")
+            except Exception as e:
+                # Re-check the blob next time in case it was deleted or never created.
+                self._ready_blobs.discard(blob_name)
+                print(f"❌ Error appending to blob: {e}")
+
+
+_shippers = {}
+_shippers_lock = threading.Lock()
+
+
+def get_log_shipper(container_name: str, connection_string: str) -> LogShipper:
+    with _shippers_lock:
+        shipper = _shippers.get(container_name)
+        if shipper is None:
+            shipper = _shippers[container_name] = LogShipper(container_name, connection_string)
+        return shipper
+
+
+@atexit.register
+def flush_logs():
+    with _shippers_lock:
+        shippers = list(_shippers.values())
+    for shipper in shippers:
+        shipper.close()
+
+
+def log_query_to_blob(container_name, resource_id, benchmark_code, benchmark_id, query,processing_time, lesson_plan, ai_output, dedup_key=None, metrics=None):
+    """
+    Queue one structured log record. metrics may carry timings (seconds per step),
+    token counts, the response cache tier and similar per-request numbers.
+    """
     connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
     if not connection_string:
         raise ValueError("❌ AZURE_STORAGE_CONNECTION_STRING not found.")
 
     now = datetime.now()
-    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-    date = now.strftime("%Y-%m-%d")
-    blob_name = f"lesson_logs_{date}.txt"  # 👈 daily file
-    ai_output=remove_inline_download_links(ai_output)
-    formatted_lesson = convert_markdown_to_clean_text(lesson_plan)
-    formatted_ai = convert_markdown_to_clean_text(ai_output)
-
-    log_entry = f"""Time: {timestamp}
-Resource ID: {resource_id}
-Benchmark Code: {benchmark_code}
-Benchmark ID: {benchmark_id}
-Query: {query}
-Processing Time: {processing_time:.2f} seconds
-📘 Lesson Plan:
-{formatted_lesson}
-
-✨ AI Customization:
-{formatted_ai}
-
-------------------------------------------------------------------------------------------------------------
-"""
-    try:
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-
-        if not blob_client.exists():
-            blob_client.create_append_blob()
-
-        blob_client.append_block(log_entry.encode('utf-8'))
-
-        print("✅ Log entry appended successfully.")
-
-    except Exception as e:
-        print(f"❌ Error appending to blob: {e}")
+    blob_name = f"{LOG_BLOB_PREFIX}{now.strftime('%Y-%m-%d')}.jsonl"  # 👈 daily file
+    record = {
+        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "resource_id": resource_id,
+        "benchmark_code": benchmark_code,
+        "benchmark_id": benchmark_id,
+        "query": query,
+        "query_hash": query_hash(query),
+        "processing_time": round(processing_time, 3),
+    }
+    record.update(metrics or {})
+    record["lesson_plan"] = lesson_plan
+    record["ai_output"] = ai_output
+    return get_log_shipper(container_name, connection_string).enqueue(blob_name, record, dedup_key=dedup_key)
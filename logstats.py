@@ -0,0 +1,190 @@
+"""
+Summarise the JSONL query logs written by log_to_blob.
+
+    python logstats.py --dir ./logs
+    python logstats.py --container datastorage --since 2026-10-01 --top 20
+
+Files are streamed line by line through generators, latency percentiles come from a fixed
+log-scale histogram and top resources from a bounded space-saving counter, so memory stays
+flat however many days of logs are read.
+"""
+import os
+import sys
+import json
+import math
+import glob
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_BLOB_PREFIX = "lesson_logs_"
+# Latency buckets grow by 5%, so a percentile is off by at most that much.
+_BUCKET_GROWTH = 1.05
+_BUCKET_MIN = 0.001
+# Distinct resources tracked exactly before the top-k counter starts approximating.
+TOP_K_CAPACITY = 1000
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        bucket = 0 if seconds <= _BUCKET_MIN else int(math.log(seconds / _BUCKET_MIN, _BUCKET_GROWTH)) + 1
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = math.ceil(p / 100 * self.total)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                upper = _BUCKET_MIN * _BUCKET_GROWTH ** bucket
+                return min(upper, self.max)
+        return self.max
+
+
+class TopK:
+    """Space-saving heavy hitters: at most capacity counters, exact for keys that stay in the top"""
+
+    def __init__(self, k: int, capacity: int = TOP_K_CAPACITY):
+        self.k = k
+        self.capacity = max(capacity, k)
+        self.counts = {}
+
+    def add(self, key, weight: float = 1):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = self.counts.get(key, 0) + weight
+            return
+        smallest = min(self.counts, key=self.counts.get)
+        self.counts[key] = self.counts.pop(smallest) + weight
+
+    def top(self):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:self.k]
+
+
+def _in_range(name: str, since: str, until: str) -> bool:
+    date = os.path.basename(name)[len(LOG_BLOB_PREFIX):len(LOG_BLOB_PREFIX) + 10]
+    return (not since or date >= since) and (not until or date <= until)
+
+
+def local_lines(directory: str, since: str = "", until: str = ""):
+    for path in sorted(glob.glob(os.path.join(directory, f"{LOG_BLOB_PREFIX}*.jsonl"))):
+        if _in_range(path, since, until):
+            with open(path, "r", encoding="utf-8") as f:
+                yield from f
+
+
+def blob_lines(container_name: str, since: str = "", until: str = ""):
+    from blobclients import get_container_client
+    container = get_container_client(container_name)
+    for blob in container.list_blobs(name_starts_with=LOG_BLOB_PREFIX):
+        if not blob.name.endswith(".jsonl") or not _in_range(blob.name, since, until):
+            continue
+        pending = b""
+        for chunk in container.download_blob(blob.name).chunks():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8", errors="replace")
+        if pending:
+            yield pending.decode("utf-8", errors="replace")
+
+
+def parse_records(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def summarize(records, top: int = 10) -> dict:
+    latency = LatencyHistogram()
+    steps = {}
+    resources = TopK(top)
+    token_spend = TopK(top)
+    tokens = {}
+    cache = {}
+    requests = 0
+
+    for record in records:
+        requests += 1
+        latency.add(float(record.get("processing_time", 0.0)))
+        for step, seconds in (record.get("timings") or {}).items():
+            steps.setdefault(step, LatencyHistogram()).add(float(seconds))
+        resource = str(record.get("resource_id", ""))
+        resources.add(resource)
+        record_tokens = record.get("tokens") or {}
+        for kind, count in record_tokens.items():
+            tokens[kind] = tokens.get(kind, 0) + count
+        token_spend.add(resource, sum(record_tokens.values()))
+        tier = record.get("cache", "unknown")
+        cache[tier] = cache.get(tier, 0) + 1
+
+    def percentiles(histogram):
+        return {f"p{p}": round(histogram.percentile(p), 3) for p in (50, 95, 99)}
+
+    return {
+        "requests": requests,
+        "processing_time": percentiles(latency),
+        "steps": {step: percentiles(histogram) for step, histogram in sorted(steps.items())},
+        "tokens": tokens,
+        "cache": cache,
+        "top_resources": resources.top(),
+        "top_token_spend": token_spend.top(),
+    }
+
+
+def print_report(summary: dict):
+    print(f"Requests: {summary['requests']}")
+    latency = summary["processing_time"]
+    print(f"Processing time: p50 {latency['p50']}s, p95 {latency['p95']}s, p99 {latency['p99']}s")
+    for step, values in summary["steps"].items():
+        print(f"  {step}: p50 {values['p50']}s, p95 {values['p95']}s, p99 {values['p99']}s")
+    print("Tokens: " + ", ".join(f"{kind} {count}" for kind, count in sorted(summary["tokens"].items())))
+    print("Response cache: " + ", ".join(f"{tier} {count}" for tier, count in sorted(summary["cache"].items())))
+    print("Top resources:")
+    for resource, count in summary["top_resources"]:
+        print(f"  {resource}: {count:g} request(s)")
+    print("Top token spend:")
+    for resource, count in summary["top_token_spend"]:
+        print(f"  {resource}: {count:g} tokens")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency, usage and token rollups from the JSONL query logs")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="local directory with lesson_logs_*.jsonl files")
+    source.add_argument("--container", help="blob container holding the daily log blobs")
+    parser.add_argument("--since", default="", help="first day to include, YYYY-MM-DD")
+    parser.add_argument("--until", default="", help="last day to include, YYYY-MM-DD")
+    parser.add_argument("--top", type=int, default=10, help="how many resources to list")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.dir:
+        lines = local_lines(args.dir, args.since, args.until)
+    else:
+        lines = blob_lines(args.container, args.since, args.until)
+    summary = summarize(parse_records(lines), top=args.top)
+
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
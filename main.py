@@ -1,10 +1,5 @@
 import streamlit as st
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from azure.core.pipeline.policies import RetryPolicy
-from openai import AzureOpenAI
 from dotenv import load_dotenv
-import re
 import os
 import base64
 import json
@@ -14,15 +9,16 @@ import time
 import hashlib
 import uuid
 from datetime import datetime
-from rapidfuzz import process
-from rapidfuzz import fuzz
-import asyncio
-from io import BytesIO
-from docx import Document
-from getdatafromblob import fetch_and_get_lesson,format_lesson_output
-from dataformatting import convert_markdown_to_bold_html,convert_markdown_to_bold_html_1,convert_markdown_to_clean_text,convert_markdown_to_clean_text_for_docs
-from log_to_blob import log_query_to_blob
-from convert_to_pdf import generate_structured_pdf
+from rendercache import render
+from exports import export_cache, export_service, ExportQueueFull, EXPORT_FORMATS
+from artifactstore import artifact_store, artifact_link, find_artifact_links, remove_artifact_links
+from benchmarks import allowed_benchmark_codes, normalize_benchmark_code
+from tracing import waterfall_html
+from service import (
+    prepare_request, customize_events, clean_ai_response, combined_export_text,
+    LessonRequestError, OPENAI_STREAMING, EXPORT_TITLE,
+)
+from apiclient import remote_events, fetch_artifact, CUSTOMIZER_API_URL
 
 
 
@@ -34,17 +30,36 @@ def get_user_id():
 
 
 
-async def async_azure_openai_call(messages):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(
-        None,
-        lambda: client.chat.completions.create(
-            model=OPENAI_DEPLOYMENT_NAME,
-            messages=messages,
-            temperature=0.9,
-            max_tokens=16384
-        )
-    )
+def render_customization_events(events):
+    """Show attachments and the AI output live as the service reports them; returns the final result"""
+    placeholder = None
+    parts = []
+    last_render = 0.0
+    for event in events:
+        if event["event"] == "context":
+            st.session_state.lesson_plan_output = event["lesson_plan"]
+            attachments_hyperlinks = event["attachments_hyperlinks"]
+            attachments_hyperlinks_list = attachments_hyperlinks.split("\n") if attachments_hyperlinks else []
+            cnt = event["attachment_count"]
+            if cnt > 0:
+                st.markdown(f"**📁 Retrieved data from {cnt} attachment(s):**")
+                for link in attachments_hyperlinks_list:
+                    if link.strip():  # Only show non-empty links
+                        st.markdown(f"- {link}", unsafe_allow_html=True)
+            else:
+                st.warning("⚠️ No attachments found for this Resource ID")
+            placeholder = st.empty()
+        elif event["event"] == "delta":
+            parts.append(event["text"])
+            now = time.time()
+            if now - last_render >= STREAM_RENDER_INTERVAL:
+                placeholder.markdown(clean_ai_response("".join(parts)))
+                last_render = now
+        elif event["event"] == "result":
+            if placeholder is not None:
+                placeholder.empty()
+            return event
+    return None
 
 
 def initialize_session_history():
@@ -134,68 +149,11 @@ st.set_page_config(
 
  
 load_dotenv()
-retry_policy = RetryPolicy(retry_total=2, timeout=120)
- 
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
-AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX")
-AZURE_SEARCH_INDEX_NAME_1 = os.getenv("AZURE_SEARCH_INDEX_1")
-AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_KEY")
- 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION")
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-OPENAI_DEPLOYMENT_NAME = os.getenv("OPENAI_DEPLOYMENT_NAME")
- 
-search_client = SearchClient(
-    endpoint=AZURE_SEARCH_ENDPOINT,
-    index_name=AZURE_SEARCH_INDEX_NAME,
-    credential=AzureKeyCredential(AZURE_SEARCH_API_KEY),
-    retry_policy=retry_policy
-)
- 
-search_client_1 = SearchClient(
-    endpoint=AZURE_SEARCH_ENDPOINT,
-    index_name=AZURE_SEARCH_INDEX_NAME_1,
-    credential=AzureKeyCredential(AZURE_SEARCH_API_KEY),
-    retry_policy=retry_policy
-)
- 
-client = AzureOpenAI(
-    api_key=OPENAI_API_KEY,
-    api_version=OPENAI_API_VERSION,
-    azure_endpoint=OPENAI_API_BASE
-)
+STREAM_RENDER_INTERVAL = float(os.getenv("STREAM_RENDER_INTERVAL", "0.15"))
  
-allowed_benchmark_codes = {
-    'ELA.1.R.1.4', 'ELA.1.R.3.1', 'ELA.4.V.1.3', 'ELA.5.V.1.1', 'ELA.5.V.1.3', 'ELA.6.V.1.3', 'ELA.7.C.1.3',
-    'ELA.7.C.4.1', 'ELA.K.C.1.3', 'ELA.K.R.1.3', 'ELA.K.R.1.4', 'ELA.K.R.2.1', 'ELA.K.R.2.2', 'ELA.K.R.3.1',
-    'ELA.K12.EE.1.1', 'ELA.K12.EE.2.1', 'ELA.K12.EE.3.1', 'ELA.K12.EE.4.1', 'ELA.K12.EE.6.1', 'MA.1.AR.1.1',
-    'MA.1.GR.1.3', 'MA.1.NSO.1.1', 'MA.1.NSO.2.2', 'MA.1.NSO.2.4', 'MA.1.NSO.2.5', 'MA.2.AR.3.1', 'MA.2.AR.3.2',
-    'MA.3.AR.1.1', 'MA.3.NSO.2.2', 'MA.3.NSO.2.4', 'MA.4.DP.1.2', 'MA.5.DP.1.2', 'MA.5.M.1.1', 'MA.5.NSO.2.4',
-    'MA.5.NSO.2.5', 'MA.6.AR.3.2', 'MA.6.DP.1.2', 'MA.6.DP.1.3', 'MA.6.DP.1.4', 'MA.6.DP.1.5', 'MA.6.DP.1.6',
-    'MA.6.GR.2.3', 'MA.6.GR.2.4', 'MA.6.NSO.2.3', 'MA.7.AR.3.1', 'MA.7.DP.1.1', 'MA.7.DP.1.2', 'MA.7.DP.1.5',
-    'MA.7.DP.2.1', 'MA.8.F.1.3', 'MA.912.AR.1.3', 'MA.912.DP.1.1', 'MA.912.DP.1.2', 'MA.912.DP.1.4', 'MA.912.DP.2.1',
-    'MA.912.DP.2.2', 'MA.912.DP.3.5', 'MA.912.T.3.3', 'MA.K.AR.1.1', 'MA.K.AR.1.2', 'MA.K.AR.1.3', 'MA.K.DP.1.1',
-    'MA.K.GR.1.1', 'MA.K.GR.1.2', 'MA.K.GR.1.5', 'MA.K.M.1.2', 'MA.K.M.1.3', 'MA.K.NSO.1.1', 'MA.K.NSO.1.2',
-    'MA.K.NSO.1.4', 'MA.K.NSO.2.1', 'MA.K.NSO.2.3', 'MA.K.NSO.3.1', 'MA.K.NSO.3.2', 'SS.7.CG.3.13', 'SS.7.CG.4.2',
-    'SS.K.CG.2.2', 'SS.K.CG.2.4'
-}
  
 
 
-def convert_attachment_paths_to_links(paths):
-    seen = set()
-    unique_paths = []
-    for path in paths:
-        if path not in seen:
-            seen.add(path)
-            unique_paths.append(path)
-
-    hyperlinks = []
-    for i, url in enumerate(unique_paths, start=1):
-        filename = os.path.basename(url)
-        hyperlinks.append(f"{i}. [{filename}]({url})")
-    return "\n".join(hyperlinks) 
 def reset_session_state():
     """Reset session state for new query processing"""
     st.session_state.lesson_content = ""
@@ -221,22 +179,6 @@ def should_process_query():
     """Determine if query should be processed (new query or empty lesson content)"""
     return not st.session_state.lesson_content or has_query_changed()
  
-def clean_ai_response(text):
-    """Clean AI response by removing separators, extra whitespace, and leading '#'"""
-    text = re.sub(r'---\s*Chunk\s*\d+\s*Response\s*---', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-    text = text.strip()
-    lines = text.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        line = re.sub(r'^#+\s*', '', line)
-        cleaned_line = line.strip()
-        if cleaned_line and not re.match(r'^[-\s]*$', cleaned_line):
-            cleaned_lines.append(line)
-   
-    return '\n'.join(cleaned_lines)
- 
-
 st.markdown("""
 <style>
     /* Reset and base styles */
@@ -472,103 +414,6 @@ if os.path.exists("/home/rohan/Downloads/CPalms 2/CPalms/cpalmslogo.png"):
 
 
 
-def fuzzy_match_any_word(query, keywords, threshold):
-    words = re.findall(r'\w+', query.lower())
-    for word in words:
-        match, score, _ = process.extractOne(word, keywords, scorer=fuzz.ratio)
-        if score >= threshold:
-            return True
-    return False
-
- 
-def validate_educational_query(query: str) -> tuple[bool, str]:
-    """
-    Validate if the query is education-related and appropriate for lesson planning.
-    Returns (is_valid, error_message)
-    """
-    query_lower = query.lower()
-    
-    educational_keywords = [
-        'lesson', 'teaching', 'learning', 'student', 'classroom', 'activity', 'assessment', 
-        'question', 'instruction', 'practice', 'exercise', 'worksheet', 'curriculum',
-        'education', 'academic', 'school', 'grade', 'objective', 'skill', 'concept',
-        'homework', 'assignment', 'project', 'discussion', 'explanation', 'example',
-        'strategy', 'method', 'approach', 'technique', 'guidance', 'support', 'help',
-        'understand', 'learn', 'study', 'review', 'prepare', 'develop', 'improve',
-        'compare','help','prior knowledge','exam','plan','phases','collaborative activities',
-        'knowledge', 'comprehension', 'mastery', 'benchmark', 'standard', 'goal',
-        'outcome', 'performance', 'progress', 'achievement', 'rubric', 'criteria','quiz',
-        'engage', 'explore', 'explain', 'elaborate', 'evaluate',
-        'lesson plan', 'activity sheet', 'outcomes',
-        'formative', 'summative', 'differentiation', 'scaffold', 'modification',
-        'tactile', 'visual', 'auditory', 'kinesthetic','activity',
-        'station', 'task', 'modeling', 'demonstration',
-        'group work', 'pair work', 'independent work','learning stations'
-    ]
-    
-    inappropriate_keywords = [
-        'celebrity', 'gossip', 'politics', 'religion', 'personal',
-        'dating', 'financial advice', 'medical advice', 'legal advice','gun','weapon',
-        'inappropriate', 'violence', 'drugs', 'alcohol', 'gambling', 'adult content',
-        'stock','investment'
-    ]
-    
-        
-    if fuzzy_match_any_word(query_lower, inappropriate_keywords, threshold=96):
-        return False, "❌ This query contains inappropriate or off-topic content. Please focus on educational content such as lesson plans, activities, or assessments."
-
-
-    if not fuzzy_match_any_word(query_lower, educational_keywords, threshold=70):
-        return False, "❌ This query doesn't appear to be education-related. Please ask about lesson plans, teaching strategies, assessments, activities, or other educational content."
-
-    
-    return True, ""
-
-
-
-def extract_required_section_from_query(query: str) -> list:
-    """
-    Extracts section types from a user's natural language query, such as
-    assessments, activities, stations, prior knowledge, etc.
-    """
-    keywords = {
-        "assessments": [
-            "assessment", "assessments", "assessment questions", "quiz", "quizzes",
-            "formative assessment", "summative assessment", "assessment games", "assessment rubrics"
-        ],
-        "prior_knowledge": [
-            "prior knowledge", "prior knowledge requirements", "prior knowledge checklist","plan"
-        ],
-        "stations": [
-            "station", "stations", "learning stations", "study stations", "problem-solving stations",
-            "collaborative stations", "peer review stations", "station rotations"
-        ],
-        "activities": [
-            "activity", "activities", "hands-on activities", "interactive activities",
-            "collaborative activities", "creative workshops", "movement-based learning",
-            "real-world applications", "context activities", "skill-building games", "investigations"
-        ],
-        "guiding_questions": [
-            "guiding questions", "guiding question"
-        ]
-    }
- 
-    matched_sections = []
-    q_lower = query.lower()
- 
-    for section, trigger_phrases in keywords.items():
-        for phrase in trigger_phrases:
-            if phrase in q_lower:
-                matched_sections.append(section)
-                break  
- 
-    return matched_sections
- 
- 
-
-
-
-
 def initialize_session_state():
     """Safely initialize all session state variables used throughout the app"""
     defaults = {
@@ -587,64 +432,6 @@ def initialize_session_state():
             st.session_state[key] = default
 
 
-def generate_docx_file(content: str, title: str = "CPALMS Lesson Plan"):
-    content = re.sub(r'\n\s*\n+', '\n', content.strip())
-
-    doc = Document()
-    doc.add_heading(title, level=0)
-
-    for para in content.split("\n"):
-        if not para.strip():
-            doc.add_paragraph("")
-            continue
-
-        paragraph = doc.add_paragraph()
-        while "**" in para:
-            before, rest = para.split("**", 1)
-            bold_text, after = rest.split("**", 1)
-            paragraph.add_run(before)
-            run = paragraph.add_run(bold_text)
-            run.bold = True
-            para = after
-        paragraph.add_run(para)  
-
-    return doc
-
-def extract_test_or_worksheet_section(text: str) -> str:
-    """
-    Extract the section of the AI output that includes a worksheet, quiz, or test.
-    Looks for headings like '## Worksheet' or '## Quiz Questions' and captures everything
-    until the next heading or end of text.
-    """
-    pattern = r"(##\s*(Worksheet|Quiz|Test)[\s\S]*?)(?=\n##|\Z)"
-    match = re.search(pattern, text, flags=re.IGNORECASE)
-    
-    if match:
-        return match.group(1).strip()
-    else:
-        question_lines = []
-        for line in text.splitlines():
-            if any(q in line.lower() for q in ["question", "?", "1.", "a)", "b)", "answer"]):
-                question_lines.append(line)
-        return "\n".join(question_lines).strip()
-    
-
-def remove_inline_download_links(text: str) -> str:
-    return re.sub(
-        r'📄.*?\(data:application\/vnd\.openxmlformats-officedocument\.wordprocessingml\.document;base64,[^)]+\)',
-        '', 
-        text
-    )
-
-def make_docx_link(doc_buffer):
-    doc_buffer.seek(0)
-    b64 = base64.b64encode(doc_buffer.read()).decode()
-    return f'data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{b64}'
-def replace_generate_docx_link(markdown_text, doc_buffer):
-    data_uri = make_docx_link(doc_buffer)
-    return re.sub(r'\[(.*?)\]\(#GENERATE_DOCX_LINK\)', rf'[\1]({data_uri})', markdown_text)
-
-    
 def create_query_form():
     with st.form(key="query_form", clear_on_submit=False):
         col1, col2, col3 = st.columns([1, 1, 1])
@@ -670,27 +457,6 @@ def create_query_form():
 
 
 
-def normalize_benchmark_code(user_input):
-    cleaned = re.sub(r'[^A-Za-z0-9]', '', user_input).upper()
-    if cleaned in [re.sub(r'[^A-Za-z0-9]', '', b) for b in allowed_benchmark_codes]:
-        for code in allowed_benchmark_codes:
-            if cleaned == re.sub(r'[^A-Za-z0-9]', '', code):
-                return code
-
-    cleaned_allowed = {re.sub(r'[^A-Za-z0-9]', '', b): b for b in allowed_benchmark_codes}
-    match, score, _ = process.extractOne(
-        cleaned,
-        list(cleaned_allowed.keys()),
-        scorer=fuzz.ratio
-    )
-
-    if score >= 80:
-        return cleaned_allowed[match]
-
-    return None
-
-
-
 def should_process_new_query(query, resource_id, benchmark_code, benchmark_id):
     current_query_key = f"{query}_{resource_id}_{benchmark_code}_{benchmark_id}"
 
@@ -704,178 +470,47 @@ def should_process_new_query(query, resource_id, benchmark_code, benchmark_id):
     return False
  
  
-def generate_creative_response(query, des, grade_level, resource_id, benchmark, attachments_hyperlinks, docs_data, combined_chunks):
-    """
-    Generate a creative, comprehensive response for the specific question asked,
-    using available lesson plan context and search results.
-    """
-    user_id = get_user_id()
-    user_history = st.session_state.user_histories.get(user_id, [])
-    
-    history_context = ""
-    previous_full_response = ""
-    is_follow_up = False
-    
-    if user_history:
-        current_session = [entry for entry in user_history 
-                          if entry['resource_id'] == resource_id and entry['benchmark'] == benchmark]
-        if current_session:
-            is_follow_up = True
-            latest_entry = current_session[-1]
-            previous_entry = latest_entry
-
-            history_context = ""
-
-            if previous_entry:
-                prev_response = previous_entry["ai_output"]
-
-                split_parts = prev_response.split("📘 **Previous Response**")
-
-                if len(split_parts) > 1:
-                    new_content_only = split_parts[0].strip()
-                    history_context += f"**Previous Response (New Content Portion Only):**\n{new_content_only}\n\n"
-                else:
-                    history_context += f"**Previous Response:**\n{prev_response.strip()}\n\n"
-
-        else:
-            history_context = "\n**Previous Session Context:**\n"
-            for i, entry in enumerate(user_history[-2:], 1):  # Include last 2 queries for context
-                history_context += f"{i}. Previous Query: {entry['query']}\n"
-                history_context += f"   Resource ID: {entry['resource_id']}, Benchmark: {entry['benchmark']}\n"
-                history_context += f"   Previous Response Summary: {entry['ai_output'][:300]}...\n\n"
-    history_context=remove_inline_download_links(history_context)
-    print("=== HISTORY CONTEXT SENT TO OPENAI ===")
-    print(f"User ID: {user_id}")
-    print(f"Number of history entries: {len(user_history)}")
-    print("History context being sent:")
-    print(history_context if history_context else "No history context")
-    print("=== END HISTORY CONTEXT ===")
-    
-    system_content = f"""
-You are a creative educational content generator specializing in lesson plan enhancement for CPALMS (Collaborative Planning for Learning in Mathematics and Science).
-
-**STRICT OPERATIONAL GUIDELINES:**
-- You MUST ONLY respond to queries related to education, lesson planning, teaching strategies, assessments, questions,quiz and classroom activities
-- You MUST NOT respond to queries about weather reports, sports reports, celebrities, politics, personal advice, medical/legal advice, or any non-educational topics
-- If a query is not education-related respond with: "I can only assist with educational content and lesson planning. Please ask about teaching strategies, assessments, activities,quiz or other lesson plan components."
-- ALL responses must be directly related to the provided Resource ID, Benchmark, {query},{des} and {grade_level}.
-- Stay on-topic and within educational context at all times and never attempt to interpret non-educational requests as educational.
-- Generate the data based on only the {des} and {grade_level} only.example:for "grade :K,des:students knows numbers upto 5,response:should contain numbers till 5 not beyond."
-- If user asks to create a worksheet, quiz, or test (e.g., "create 10-question test"), you MUST generate the actual content (not just suggestions), formatted with questions and answer choices where appropriate.
-- If the user requests or if the content logically involves a worksheet, quiz, or test (even implicitly), DO NOT suggest that the teacher create one. INSTEAD, generate the full worksheet/test content directly.
-- Never use or echo {attachments_hyperlinks}. Instead, insert this exact placeholder for downloads:[📄 Download Worksheet as doc](#GENERATE_DOCX_LINK).Always include it at the end or with the content.
-
-**Context:**
-- Resource ID: {resource_id}
-- Benchmark: {benchmark}
-- Available lesson plan sections: Learning Objectives, Prior Knowledge, Guiding Questions, Teaching Phase, Guided Practice, Independent Practice, Closure, Assessments, Accommodations, etc.
-- Attachments: {attachments_hyperlinks}
-- Follow-up Request: {"YES - This is a follow-up request" if is_follow_up else "NO - This is a new request"}
-
-{history_context}
-
-**Your Task:**
-Analyze the user's specific request: "{query}"
-Analyze the following lesson description, grade level and {query}, then generate creative content aligned with it:\n\ngrade Level: {grade_level}\ndescription: {des}
-
-**CRITICAL INSTRUCTIONS BASED ON REQUEST TYPE:**
-
-{"**THIS IS A FOLLOW-UP REQUEST:**" if is_follow_up else "**THIS IS A NEW REQUEST:**"}
-
-{'''
-- You MUST include the *COMPLETE* previous response in your output.
-- HOWEVER, display the NEW content FIRST, and the previous response BELOW it satisfying -**If the user's query asks to *remove* or *exclude* previous responses (e.g., "ignore previous", "remove old content", "start fresh"), then do NOT include the ## 📘 **Previous Response** or if ## 📘 **Previous Response** has multiple sections remove that mentioned section and continue.**
-- **If the user's query asks to *remove* or *exclude* previous responses (e.g., "ignore previous", "remove old content", "start fresh"), then do NOT include the ## 📘 **Previous Response** or remove that particular section in previous response and continue. Just generate new content as if this were a new request.**
-- If user specifies to "remove" specific section then remove it from previous response. 
- - Use clear headers and spacing to visually separate them.
-- For example if previous response is there then,
-    ## ✨ **Latest Customization**
-    [new additions]
-        
- 
-    ## 📘 **Previous Response**
-    [complete previous content]
-- This layout ensures the newest information is always shown at the top of the output it is mandatory to use the same format if previous response is present.
-- This ensures the user sees both the original content AND the new additions in one complete response
-- Maintain consistency with the previous response's style and format
-- DO NOT reuse wording or content from the attachments or provided document context unless explicitly asked to summarize it.
-- For worksheets, quizzes, or tests, you MUST generate **original content** that is not found in the attachments or lesson data.
-- Do not include file names or references from the attachments unless the user says “use that file.”
-- If asked for more of the same type (e.g., "add more stations"), continue numbering from where the previous response ended''' if is_follow_up else '''- Generate complete, comprehensive content from scratch
-- Provide thorough coverage of the requested topic
-- Create standalone content that doesn't assume previous context
-- Be comprehensive and detailed in your initial response'''}
-
-
-
-**Content Guidelines:**
-1. **Be creative and engaging** - Use varied teaching strategies, real-world connections, and student-centered approaches  
-2. **Use provided data as foundation** - Build upon existing lesson content when relevant
-3. **Format appropriately** - Use clear headings, bullet points, and structured content
-4. **Be comprehensive** - Provide detailed, actionable content (minimum 1000 words per section requested)
-5. **Include practical examples** - Give specific activities, questions, or scenarios
-6. ****Strict grade-level appropriateness** - Ensure all content is developmentally appropriate for the specified grade level. For Kindergarten, avoid complex word problems, multi-step logic, or real-world contexts that require abstract thinking. Use simple language, visual elements, and tactile-friendly examples.**
-
-
-**For specific request types:**
-- **Assessments**: Create varied question types (multiple choice, short answer, performance tasks) - **minimum 10 questions**. DO NOT reuse questions from attachments. Provide original questions. At the end, insert a link like: [📄 Download Worksheet as doc](#GENERATE_DOCX_LINK)
-- **Activities**: Design hands-on, collaborative, and differentiated activities
-- **Stations**: Create 3-5 distinct learning stations with clear objectives and descriptions  
-- **Prior Knowledge**: Identify prerequisites and diagnostic strategies (minimum 2000 words if requested)
-- **Guiding Questions**: Develop thought-provoking, inquiry-based questions
-- Do NOT use any attachments_hyperlinks. Instead, insert this link:[📄 Download Worksheet as doc](#GENERATE_DOCX_LINK)
-
-
-### 📄 Worksheet / Assessment DOC Generation Rules
-- Never say “create a worksheet” or suggest that a teacher prepares one. Always generate it directly and strictly based on {grade_level} and {des} instructions given above.
-- If needed, say exactly:
-    You can use the following worksheet with students:
-    [📄 Download Worksheet as doc](#GENERATE_DOCX_LINK)
-- Then generate the full content in the DOC. Adjust the format based on the type:
-  - **Worksheets**: Start with **Name:** ________  **Date:** ________, then 10+ grade-appropriate questions, end with an **Answer Key**
-  - **Quizzes**: Include clear questions (MCQs, short answer), instructions, and an Answer Key
-  - **Plans**: Use a structured format with headings, instructions, and space for student responses
-- Generate the DOC if:
-  1. The user requests a worksheet, quiz, or assessment “as doc”
-  2. Your response recommends using one (e.g., “students should complete a worksheet”)
-- Everything should be matched according to grade only. like if it is for Kindergarten,they cannot solve word questions.
-
-
-### Additional Enforcement Rules:
-- For Kindergarten:
-  - **Focus on visual, tactile, symbolic, or object-based interactions only — such as sorting, counting pictures, or matching icons (e.g., 🍎 + 🍌 = ?)**.
-  - You must only generate questions and content based on the provided lesson {des} and {grade_level}. Do NOT introduce standards, objectives, or math skills beyond what is described.
-  - Do NOT include word problems, narrative questions, or reading-based scenarios unless the description clearly states that students are ready for them.
-  - Do NOT include number combinations or equations involving values beyond the specified range. For example, if students are learning to count or sort objects, do not include making 10, subtraction, or addition beyond 5 unless described.
-- If a worksheet, quiz, or assessment is generated as a downloadable document, its content must NOT be repeated in the AI Customization response area. The AI customization must contain supporting or instructional content only — not the exact worksheet/quiz content — unless the user explicitly requests the questions be shown in both places.
-- If the user's query requests to “remove previous,” “exclude old content,” “start fresh,” or similar — you MUST fully omit the `## 📘 Previous Response` block and all of its contents, including any quizzes, assessments, stations, or other structured sections.
-- If the user specifies to “remove” or “replace” only a **specific section** (e.g., “remove previous quiz only” or “remove station 3”), then remove only that part from the `## 📘 Previous Response` block and regenerate it as new inside the `## ✨ Latest Customization` section. Keep the rest of the previous response unchanged.
-
-
-**Output Format:**
-Provide clean, well-organized content with clear section headers and practical details.
-Use markdown formatting for better readability.
-"""
-
-    messages = [
-        {"role": "system", "content": system_content},
-        {"role": "user", "content": f"""
-REMINDER: Only respond to educational queries related to lesson planning, teaching, assessments, or classroom activities. Refuse any non-educational requests.
-
-User Query: {query}
+def run_customization(customization_request):
+    """Action layer: hand the request to the service (in-process or over HTTP) and record the result. Runs only on submit."""
+    user_history = st.session_state.user_histories.get(get_user_id(), [])
+    dedup_key = f"{st.session_state.user_id}:{st.session_state.last_query_key}"
+    if CUSTOMIZER_API_URL:
+        events = remote_events(
+            customization_request.resource_id, customization_request.benchmark_code,
+            customization_request.benchmark_id, customization_request.query,
+            history=user_history, stream=OPENAI_STREAMING, dedup_key=dedup_key
+        )
+    else:
+        events = customize_events(customization_request, history=user_history, stream=OPENAI_STREAMING, dedup_key=dedup_key)
 
-Available Lesson Data: {docs_data}
+    error_message = "⚠️ The lesson service returned no result. Please try again."
+    with st.spinner('🔄 Processing your request...'):
+        try:
+            result = render_customization_events(events)
+        except LessonRequestError as e:
+            result = None
+            error_message = str(e)
+        finally:
+            events.close()
+    if result is None:
+        st.warning(error_message)
+        st.stop()
 
-Additional Context from Attachments: {combined_chunks}
+    st.session_state.last_trace = {"trace_id": result["trace_id"], "spans": result["trace"]}
+    st.session_state.lesson_plan_output = result["lesson_plan"]
+    st.session_state.lesson_content = result["ai_output"]
+    if result["worksheet_id"]:
+        st.session_state["worksheet_docx"] = result["worksheet_id"]
+
+    add_to_history(
+        query=customization_request.query,
+        resource_id=customization_request.resource_id,
+        benchmark=result["benchmark"],
+        lesson_plan=st.session_state.lesson_plan_output,
+        ai_output=st.session_state.lesson_content
+    )
 
-{'IMPORTANT: This is a follow-up request. Your response can include the COMPLETE previous response shown in the system context above untill it is explicitly mentioned "remove" in {query}, followed by the new content. Start with the full previous content, then add a separator, then the new additions.' if is_follow_up else 'Generate creative, comprehensive content specifically for:'} {query}
-"""}
-    ]
-    
-    return messages
 
-start_time = time.time()
- 
 st.markdown("""
 <div class="main-header">
     <div class="main-title">🎓 CPALMS AI Lesson Plan Customizer</div>
@@ -891,27 +526,10 @@ st.markdown("### 💬 Enter Your Query")
 resource_id_input, benchmark_code_input, benchmark_id_input, query, submit_clicked = create_query_form()
 
 if submit_clicked:
-    resource_id_input = resource_id_input.strip()
-    benchmark_code_input = benchmark_code_input.strip()
-    benchmark_id_input = benchmark_id_input.strip()
-    query = query.strip()
-
-    if not all([resource_id_input, benchmark_code_input, benchmark_id_input, query]):
-        st.error("⚠️ All fields are required. Please fill out Resource ID, Benchmark Code, Benchmark ID, and Query.")
-        st.stop()
-
-    if not re.fullmatch(r'\d{5,6}', resource_id_input):
-        st.error("❌ Resource ID must be a 5- or 6-digit number (only digits allowed).")
-        st.stop()
-    
-    benchmark = normalize_benchmark_code(benchmark_code_input)
-    if not benchmark:
-        st.error("❌ Please enter a valid benchmark.")
-        st.stop()
-    
-    is_valid_query, error_message = validate_educational_query(query)
-    if not is_valid_query:
-        st.error(error_message)
+    try:
+        customization_request = prepare_request(resource_id_input, benchmark_code_input, benchmark_id_input, query)
+    except LessonRequestError as e:
+        st.error(str(e))
         st.stop()
 
 if not submit_clicked and not st.session_state.lesson_content:
@@ -923,8 +541,6 @@ if not query and st.session_state.lesson_content:
     benchmark = ""
     resource_id = ""
 else:
-    requested_sections = extract_required_section_from_query(query)
-   
     if not query:
         st.stop()
  
@@ -949,113 +565,10 @@ if resource_id is None:
     """, unsafe_allow_html=True)
     st.stop()
  
-lesson_output_1 = fetch_and_get_lesson(benchmark, resource_id)
-if isinstance(lesson_output_1, str) and lesson_output_1.startswith("⚠️"):
-    st.warning(lesson_output_1) 
-    st.stop() 
-des=lesson_output_1.get("Description")
-grade_level=lesson_output_1.get("GradeLevelNames")
-title=lesson_output_1.get("Title")
-objectives_resource_ids = set()
-cnt=0
 if submit_clicked and (should_process_new_query(query, resource_id, benchmark_code_input, benchmark_id_input) or not st.session_state.lesson_content):
-
-    
-    with st.spinner('🔄 Processing your request...'):
-        query_for_resource = f"{resource_id} give all documents for this id"
-        cnt = 0
-       
-        matched_docs = []
-        search_results = search_client.search(search_text=benchmark, top=60)
-        search_results = list(search_results)
- 
-        for i, doc in enumerate(search_results):
-            doc_benchmarks = doc.get("benchmarkId", "")
-            if benchmark in doc_benchmarks:
-                doc_str = str(doc).lower()
-                if any(section in doc_str for section in requested_sections):
-                    filtered_doc = {k: v for k, v in doc.items() if k == "objectives"}
-                    matched_docs.append(filtered_doc)
- 
-        attachments = []
-        combined_chunks = ""
-        search_results_1 = search_client_1.search(search_text=query_for_resource, top=60)
-        for doc in search_results_1:
-            path = doc.get("metadata_storage_path", "")
-            match = re.search(r"/(\d{5,6})/", path)
-            if match and match.group(1) == resource_id:
-                attachments.append(path)
-                chunk = doc.get("chunk", "")
-                cnt += 1
-                combined_chunks += chunk + "\n\n"
- 
-        attachments_hyperlinks = convert_attachment_paths_to_links(attachments)
-        attachments_hyperlinks_list = attachments_hyperlinks.split("\n") if attachments_hyperlinks else []
- 
-        if cnt > 0:
-            st.markdown(f"**📁 Retrieved data from {cnt} attachment(s):**")
-            for link in attachments_hyperlinks_list:
-                if link.strip():  # Only show non-empty links
-                    st.markdown(f"- {link}", unsafe_allow_html=True)
-        else:
-            st.warning("⚠️ No attachments found for this Resource ID")
- 
- 
-        
-        docs_text = "\n\n".join([str(doc) for doc in matched_docs])
-        q1=query+" targeted at Grade: "+grade_level
-        q2=q1+" having title:"+title
-        messages = generate_creative_response(
-            query=q2,
-            des=des,
-            grade_level=grade_level,
-            resource_id=resource_id,
-            benchmark=benchmark,
-            attachments_hyperlinks=attachments_hyperlinks,
-            docs_data=docs_text,
-            combined_chunks=combined_chunks
-        )
-        
-        
-        response = asyncio.run(async_azure_openai_call(messages))
-        formatted_lesson = format_lesson_output(lesson_output_1,attachments_hyperlinks)
-        st.session_state.lesson_plan_output = formatted_lesson
-
-        lesson_output = response.choices[0].message.content
-        if "#GENERATE_DOCX_LINK" in lesson_output:
-            worksheet_section = extract_test_or_worksheet_section(lesson_output)
-            worksheet_clean = convert_markdown_to_clean_text_for_docs(worksheet_section)
-            doc = generate_docx_file(worksheet_clean, title="Student Worksheet")
-            doc_io = BytesIO()
-            doc.save(doc_io)
-            doc_io.seek(0)
-
-            lesson_output = replace_generate_docx_link(lesson_output, doc_io)
-            st.session_state["worksheet_docx"] = doc_io
-
-
-        lesson_output = clean_ai_response(lesson_output)
-        st.session_state.lesson_content = lesson_output
-
-        
-        add_to_history(
-            query=query,
-            resource_id=resource_id,
-            benchmark=benchmark,
-            lesson_plan=st.session_state.lesson_plan_output,
-            ai_output=st.session_state.lesson_content
-        )
-                
+    run_customization(customization_request)
 
 if st.session_state.lesson_content:
-    formatted_lesson = convert_markdown_to_clean_text(st.session_state.lesson_plan_output)
-    formatted_ai = remove_inline_download_links(convert_markdown_to_clean_text(st.session_state.lesson_content))
-    formatted_lesson_for_docs = convert_markdown_to_clean_text_for_docs(st.session_state.lesson_plan_output)
-    formatted_ai_for_docs = remove_inline_download_links(convert_markdown_to_clean_text_for_docs(st.session_state.lesson_content))
-
-    combined_output = f"""📘 Lesson Plan Output:\n\n{formatted_lesson}\n\n✨ AI Customization Output:\n\n{formatted_ai}"""
-    combined_output_for_docs = f"""📘 Lesson Plan Output:\n\n{formatted_lesson_for_docs}\n\n✨ AI Customization Output:\n\n{formatted_ai_for_docs}"""
-
     col1, col2, col3 = st.columns([1, 1, 0.5])
 
     with col1:
@@ -1075,27 +588,23 @@ if st.session_state.lesson_content:
         )
 
     with col2:
-        if download_format == "DOCX":
-            doc = generate_docx_file(combined_output_for_docs, title="CPALMS Lesson Plan")
-            doc_io = BytesIO()
-            doc.save(doc_io)
-            doc_io.seek(0)
-
+        export_format = download_format.lower()
+        export_text = combined_export_text(st.session_state.lesson_plan_output, st.session_state.lesson_content, export_format)
+        export_data = export_cache.get(export_format, export_text, EXPORT_TITLE)
+        if export_data is None and st.button("📦 Prepare Download", use_container_width=True, key="prepare_export_btn"):
+            with st.spinner(f"Preparing {download_format}..."):
+                try:
+                    export_data = export_service.build(export_format, export_text, EXPORT_TITLE)
+                except ExportQueueFull:
+                    st.warning("⚠️ Many downloads are being prepared right now. Please try again in a moment.")
+                except Exception as e:
+                    st.error(f"❌ Could not prepare the {download_format} file: {e}")
+        if export_data is not None:
             st.download_button(
                 label="⬇️ Download",
-                data=doc_io,
-                file_name=f"cpalms_combined_{resource_id}.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                use_container_width=True
-            )
-
-        elif download_format == "PDF":
-            pdf_buffer = generate_structured_pdf(combined_output)
-            st.download_button(
-                label="⬇️ Download",
-                data=pdf_buffer,
-                file_name=f"cpalms_combined_{resource_id}.pdf",
-                mime="application/pdf",
+                data=export_data,
+                file_name=f"cpalms_combined_{resource_id}.{EXPORT_FORMATS[export_format]['extension']}",
+                mime=EXPORT_FORMATS[export_format]["mime"],
                 use_container_width=True
             )
 
@@ -1112,7 +621,7 @@ if st.session_state.lesson_content:
         with col1:
             edited_lesson = st.text_area(
                 "Edit Lesson Plan Output:",
-                value=convert_markdown_to_clean_text(st.session_state.lesson_plan_output),
+                value=render("clean_text", st.session_state.lesson_plan_output),
                 height=400,
                 key="edit_lesson_plan"
             )
@@ -1120,14 +629,15 @@ if st.session_state.lesson_content:
         with col2:
             edited_ai = st.text_area(
                 "Edit AI Customization Output:",
-                value=convert_markdown_to_clean_text(st.session_state.lesson_content),
+                value=render("clean_text", render(remove_artifact_links, st.session_state.lesson_content)),
                 height=400,
                 key="edit_ai_customization"
             )
 
         if st.button("💾 Save Changes", use_container_width=True):
             formatted_lesson = edited_lesson
-            st.session_state.lesson_content = edited_ai
+            worksheet_links = [artifact_link(label, artifact_id) for label, artifact_id in find_artifact_links(st.session_state.lesson_content)]
+            st.session_state.lesson_content = "\n\n".join([edited_ai] + worksheet_links)
             st.session_state.edit_mode = False
             st.rerun()
 
@@ -1136,8 +646,8 @@ if st.session_state.lesson_content:
         ai_content = st.session_state.lesson_content
         if "📘 **Previous Response**" in ai_content:
             split_parts = ai_content.split("📘 **Previous Response**")
-            new_content_html = convert_markdown_to_bold_html_1(split_parts[0].strip())
-            previous_content_html = convert_markdown_to_bold_html_1(split_parts[1].strip()) if len(split_parts) > 1 else ""
+            new_content_html = render("html", remove_artifact_links(split_parts[0].strip()))
+            previous_content_html = render("html", remove_artifact_links(split_parts[1].strip())) if len(split_parts) > 1 else ""
 
             st.markdown(f"""
             <style>
@@ -1190,7 +700,7 @@ if st.session_state.lesson_content:
             <div class="split-container">
                 <div class="box">
                     <div class="left-label">📘 Lesson Plan</div>
-                    <div>{convert_markdown_to_bold_html(st.session_state.lesson_plan_output)}</div>
+                    <div>{render("lesson_html", st.session_state.lesson_plan_output)}</div>
                 </div>
                 <div class="box">
                     <div class="right-label">✨ AI Customization</div>
@@ -1250,27 +760,31 @@ if st.session_state.lesson_content:
                 </div>
             </div>
             """.format(
-                convert_markdown_to_bold_html(st.session_state.lesson_plan_output),
-                convert_markdown_to_bold_html_1(st.session_state.lesson_content)
+                render("lesson_html", st.session_state.lesson_plan_output),
+                render("html", render(remove_artifact_links, st.session_state.lesson_content))
             ), unsafe_allow_html=True)
 
+    for label, artifact_id in find_artifact_links(st.session_state.lesson_content):
+        artifact = fetch_artifact(artifact_id) if CUSTOMIZER_API_URL else artifact_store.get(artifact_id)
+        if artifact is None:
+            st.caption(f"⚠️ {label} is no longer available. Please run the request again.")
+            continue
+        st.download_button(
+            label=label,
+            data=artifact.data,
+            file_name=artifact.filename,
+            mime=artifact.mime,
+            key=f"artifact_{artifact_id}"
+        )
+
 
 
+if st.query_params.get("debug") == "1" and st.session_state.get("last_trace"):
+    last_trace = st.session_state.last_trace
+    duration = last_trace["spans"][0]["duration"] if last_trace["spans"] else 0.0
+    with st.expander(f"🛠️ Request timings ({duration:.2f}s, trace {last_trace['trace_id'][:8]})"):
+        st.markdown(waterfall_html(last_trace["spans"]), unsafe_allow_html=True)
+
 if st.session_state.lesson_content:
     st.markdown("---")
     show_history()
-
-
-end_time=time.time()
-total_seconds=end_time-start_time
-
-log_query_to_blob(
-            container_name="datastorage",
-            resource_id=resource_id,
-            benchmark_code=benchmark_code_input,
-            benchmark_id=benchmark_id_input,
-            query=query,
-            processing_time=total_seconds,
-            lesson_plan=st.session_state.lesson_plan_output,
-            ai_output=st.session_state.lesson_content
-        )
\ No newline at end of file
@@ -0,0 +1,311 @@
+"""
+Line-based Markdown renderer for the lesson and AI output views.
+
+The text is split into lines once and every renderer walks that list with plain string
+operations, instead of running a chain of full-text re.sub passes. The output of each
+renderer matches the regex chains dataformatting.py used to run exactly,
+including their handling of blank lines around headings and bold labels.
+"""
+import re
+
+_STAR_RUN = re.compile(r'\*+')
+_HTML_STRIP = str.maketrans("", "", "*#")
+_HASH_STRIP = str.maketrans("", "", "#")
+_CAPS_PREFIX = re.compile(r'[A-Z\s]*')
+
+
+def _is_blank(line: str) -> bool:
+    return not line or line.isspace()
+
+
+def parse(text: str) -> list:
+    """Split text into the line list every renderer works on."""
+    return text.split("\n")
+
+
+def _bold(line: str, render) -> str:
+    """Replace each **...** pair on a line, pairing markers left to right like \\*\\*(.*?)\\*\\*."""
+    start = line.find("**")
+    if start < 0:
+        return line
+    parts = []
+    pos = 0
+    while start >= 0:
+        end = line.find("**", start + 2)
+        if end < 0:
+            break
+        parts.append(line[pos:start])
+        parts.append(render(line[start + 2:end]))
+        pos = end + 2
+        start = line.find("**", pos)
+    parts.append(line[pos:])
+    return "".join(parts)
+
+
+def _links(line: str, render) -> str:
+    """Replace each [text](url) on a line, with the same lazy matching as \\[(.*?)\\]\\((.*?)\\)."""
+    start = line.find("[")
+    if start < 0:
+        return line
+    parts = []
+    pos = 0
+    while start >= 0:
+        middle = line.find("](", start + 1)
+        if middle < 0:
+            break
+        end = line.find(")", middle + 2)
+        if end < 0:
+            break
+        parts.append(line[pos:start])
+        parts.append(render(line[start + 1:middle], line[middle + 2:end]))
+        pos = end + 1
+        start = line.find("[", pos)
+    parts.append(line[pos:])
+    return "".join(parts)
+
+
+def _headings(lines: list, render) -> list:
+    """
+    Rewrite headings the way ^\\s*#{1,6}\\s*(.*) does in MULTILINE mode: blank lines directly
+    above a heading are absorbed, and a heading with nothing after its hashes takes its text
+    from the next non-blank line.
+    """
+    out = []
+    i = 0
+    n = len(lines)
+    for j in [k for k, line in enumerate(lines) if "#" in line and line.lstrip().startswith("#")]:
+        if j < i:
+            continue
+        start = j
+        while start > i and (not lines[start - 1] or lines[start - 1].isspace()):
+            start -= 1
+        out.extend(lines[i:start])
+        stripped = lines[j].lstrip()
+        hashes = len(stripped) - len(stripped.lstrip("#"))
+        content = stripped[min(hashes, 6):].lstrip()
+        m = j
+        while not content and m + 1 < n:
+            m += 1
+            content = lines[m].lstrip()
+        out.append(render(content))
+        i = m + 1
+    out.extend(lines[i:])
+    return out
+
+
+def _space_headings(lines: list) -> list:
+    """
+    Put exactly one blank line before headings that start in column 0, dropping trailing
+    whitespace and blank lines above them, like (?<!\\n)\\s*(^#{1,6}\\s*) -> \\n\\n\\1.
+    """
+    out = []
+    swallowed = False
+    for line in lines:
+        if swallowed:
+            if _is_blank(line):
+                out.append(line)
+                continue
+            swallowed = False
+            if line.startswith("#"):
+                # The previous heading's trailing \s* already ran up to this one.
+                out.append(line)
+                continue
+        if line.startswith("#"):
+            while out and _is_blank(out[-1]):
+                out.pop()
+            if out:
+                out[-1] = out[-1].rstrip()
+                out.append("")
+            else:
+                out.extend(["", ""])
+            out.append(line)
+            hashes = len(line) - len(line.lstrip("#"))
+            swallowed = hashes <= 6 and _is_blank(line[hashes:])
+            continue
+        out.append(line)
+    return out
+
+
+def _blank_line_before(lines: list, matches) -> list:
+    """
+    Insert a blank line before every line start where matches(index) holds, following
+    (?<!\\n)\\n?(?=^...) -> \\n\\n: only after non-empty lines, or at the very start.
+    """
+    n = len(lines)
+    out = []
+    if lines[0] != "":
+        if matches(0):
+            out.extend(["", ""])
+    elif n > 1 and not matches(1) and matches(0):
+        out.extend(["", ""])
+    for i, line in enumerate(lines):
+        out.append(line)
+        if i + 1 < n and (line != "" or i == 0) and matches(i + 1):
+            out.append("")
+    return out
+
+
+def _collapse_blank_runs(lines: list, keep_one: bool) -> list:
+    """
+    Apply \\n\\s*\\n+ to the line list: blank lines between two line breaks are dropped,
+    or replaced by a single empty line when keep_one is set.
+    """
+    last = len(lines) - 1
+    out = []
+    in_run = False
+    for i, line in enumerate(lines):
+        if 0 < i < last and _is_blank(line):
+            if keep_one and not in_run:
+                out.append("")
+            in_run = True
+            continue
+        in_run = False
+        out.append(line)
+    return out
+
+
+def _join_html(lines: list) -> str:
+    """Join with <br>, doubling it before lines that open with <b> like (?<!^)(?<!<br>)\\n(?=<b>)."""
+    out = [lines[0]]
+    for i in range(1, len(lines)):
+        line = lines[i]
+        if line.startswith("<b>"):
+            previous = lines[i - 1]
+            if not previous.endswith("<br>") and not (i == 1 and previous == ""):
+                out.append("<br><br>")
+            else:
+                out.append("<br>")
+        else:
+            out.append("<br>")
+        out.append(line)
+    # The separators hold no * or #, so one translate over the result strips the markup.
+    return "".join(out).translate(_HTML_STRIP)
+
+
+def _bold_tag(content: str) -> str:
+    return f"<b>{content}</b>"
+
+
+def _anchor(label: str, url: str) -> str:
+    return f'<a href="{url}" target="_blank">{label}</a>'
+
+
+def _inline_link(label: str, url: str) -> str:
+    return f"{label} ({url})"
+
+
+def _html_lines(text: str) -> list:
+    lines = [_bold(line, _bold_tag) if "**" in line else line for line in parse(text)]
+    return [_links(line, _anchor) if "[" in line else line for line in _headings(lines, _bold_tag)]
+
+
+def render_html(text: str) -> str:
+    """Renderer behind convert_markdown_to_bold_html_1."""
+    if not text:
+        return ""
+    return _join_html(_html_lines(text))
+
+
+def render_lesson_html(text: str) -> str:
+    """Renderer behind convert_markdown_to_bold_html: the header up to the Description line is kept compact."""
+    if not text:
+        return ""
+    description = text.find("Description:")
+    newline = text.find("\n", description + 12) if description >= 0 else -1
+    if newline < 0:
+        header, body = text, ""
+    else:
+        header, body = text[:newline + 1], text[newline + 1:]
+
+    header_lines = [line.replace("**", "").translate(_HASH_STRIP) for line in _html_lines(header)]
+    header_html = "<br>".join(_collapse_blank_runs(header_lines, keep_one=False))
+    body_html = _join_html(_collapse_blank_runs(_html_lines(body), keep_one=False))
+    return header_html + body_html
+
+
+def _starts_bold_label(lines: list):
+    """Lookahead for ^\\s*\\*\\*[^\\n]+?:\\*\\*, where the leading \\s* may cross blank lines."""
+    n = len(lines)
+    next_content = [None] * (n + 1)
+    for k in range(n - 1, -1, -1):
+        next_content[k] = next_content[k + 1] if _is_blank(lines[k]) else k
+
+    def matches(k):
+        j = next_content[k]
+        if j is None:
+            return False
+        stripped = lines[j].lstrip()
+        return stripped.startswith("**") and stripped.find(":**", 3) >= 0
+    return matches
+
+
+def _starts_caps_label(lines: list):
+    """Lookahead for ^[A-Z\\s]+:, where the capitals-and-whitespace run may cross lines."""
+    n = len(lines)
+    spans = [_CAPS_PREFIX.match(line).end() for line in lines]
+
+    continues = [False] * (n + 1)
+    for k in range(n - 1, -1, -1):
+        line = lines[k]
+        if spans[k] == len(line):
+            continues[k] = k + 1 < n and continues[k + 1]
+        else:
+            continues[k] = line[spans[k]] == ":"
+
+    def matches(k):
+        line = lines[k]
+        if spans[k] == len(line):
+            return k + 1 < n and continues[k + 1]
+        return spans[k] > 0 and line[spans[k]] == ":"
+    return matches
+
+
+def render_clean_text(text: str) -> str:
+    """Renderer behind convert_markdown_to_clean_text: plain text with upper-cased headings and labels."""
+    if not text:
+        return ""
+    lines = _headings(_space_headings(parse(text)), lambda content: f"{content.strip().upper()}:")
+    lines = _blank_line_before(lines, _starts_bold_label(lines))
+    lines = [_bold(line, str.upper) if "**" in line else line for line in lines]
+    lines = _blank_line_before(lines, _starts_caps_label(lines))
+    lines = _collapse_blank_runs([_links(line, _inline_link) if "[" in line else line for line in lines], keep_one=True)
+    return "\n".join(lines).translate(_HTML_STRIP).strip()
+
+
+def _starts_docx_label(lines: list):
+    """Lookahead for ^\\*\\*.*?\\*\\*: on the following line."""
+    def matches(k):
+        line = lines[k]
+        return line.startswith("**") and line.find("**:", 2) >= 0
+    return matches
+
+
+def _drop_single_stars(line: str) -> str:
+    if "*" not in line:
+        return line
+    return _STAR_RUN.sub(lambda m: m.group() if len(m.group()) > 1 else "", line)
+
+
+def render_docx_markdown(text: str) -> str:
+    """Renderer behind convert_markdown_to_clean_text_for_docs: only **bold** markup is kept for the DOCX writer."""
+    if not text:
+        return ""
+    lines = _headings(_space_headings(parse(text)), lambda content: f"**{content}**")
+    lines = [_bold(line, lambda content: f"**{content.strip()}**") if "**" in line else line for line in lines]
+    lines = _blank_line_before(lines, _starts_docx_label(lines))
+    lines = [_drop_single_stars(_links(line, _inline_link)) if "[" in line else _drop_single_stars(line) for line in lines]
+    lines = "\n".join(lines).translate(_HASH_STRIP).split("\n")
+    return "\n".join(_collapse_blank_runs(lines, keep_one=True)).strip()
+
+
+RENDERERS = {
+    "html": render_html,
+    "lesson_html": render_lesson_html,
+    "clean_text": render_clean_text,
+    "docx_markdown": render_docx_markdown,
+}
+
+
+def render(renderer: str, text: str) -> str:
+    """Uncached counterpart of rendercache.render, with the same argument order"""
+    return RENDERERS[renderer](text)
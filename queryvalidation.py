@@ -0,0 +1,121 @@
+import os
+import re
+import json
+from rapidfuzz import process, fuzz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUERY_KEYWORDS_FILE = os.getenv(
+    "QUERY_KEYWORDS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_keywords.json")
+)
+# -1 lets rapidfuzz use every core for the score matrix.
+QUERY_VALIDATION_WORKERS = int(os.getenv("QUERY_VALIDATION_WORKERS", "-1"))
+
+INAPPROPRIATE_MESSAGE = "❌ This query contains inappropriate or off-topic content. Please focus on educational content such as lesson plans, activities, or assessments."
+NOT_EDUCATIONAL_MESSAGE = "❌ This query doesn't appear to be education-related. Please ask about lesson plans, teaching strategies, assessments, activities, or other educational content."
+
+_WORD = re.compile(r'\w+')
+
+
+class QueryValidator:
+    """
+    Scores the word n-grams of a query against the educational and inappropriate keyword
+    sets with rapidfuzz cdist, so multi-word keywords such as "lesson plan" can match and
+    cost does not grow word by keyword in Python. An n-word gram is only scored against
+    n-word keywords (one cdist per length), since a two-word gram like "for math" can come
+    close to a one-word keyword like "formative" by characters alone.
+    """
+
+    def __init__(self, educational, inappropriate, educational_threshold=70, inappropriate_threshold=96):
+        self.educational = tuple(dict.fromkeys(k.lower() for k in educational))
+        self.inappropriate = tuple(dict.fromkeys(k.lower() for k in inappropriate))
+        self.educational_set = frozenset(self.educational)
+        self.inappropriate_set = frozenset(self.inappropriate)
+        self.educational_threshold = educational_threshold
+        self.inappropriate_threshold = inappropriate_threshold
+        # word count -> (inappropriate keywords, educational keywords) of that length
+        self.groups = {}
+        for keywords, side in ((self.inappropriate, 0), (self.educational, 1)):
+            for keyword in keywords:
+                self.groups.setdefault(len(keyword.split()), ([], []))[side].append(keyword)
+        self.max_ngram = max(self.groups, default=1)
+
+    def ngrams(self, query: str) -> dict:
+        """word count -> distinct n-grams of the query with that many words"""
+        words = _WORD.findall(query.lower())
+        return {
+            n: list(dict.fromkeys(" ".join(words[i:i + n]) for i in range(len(words) - n + 1)))
+            for n in range(1, self.max_ngram + 1)
+        }
+
+    def validate(self, query: str) -> tuple[bool, str]:
+        grams_by_length = self.ngrams(query)
+        gram_set = {gram for grams in grams_by_length.values() for gram in grams}
+        if gram_set & self.inappropriate_set:
+            return False, INAPPROPRIATE_MESSAGE
+        if not gram_set:
+            return False, NOT_EDUCATIONAL_MESSAGE
+
+        educational = bool(gram_set & self.educational_set)
+        for n, (inappropriate, educational_keywords) in self.groups.items():
+            grams = grams_by_length.get(n)
+            if not grams:
+                continue
+            scores = process.cdist(
+                grams, inappropriate + educational_keywords,
+                scorer=fuzz.ratio,
+                score_cutoff=min(self.educational_threshold, self.inappropriate_threshold),
+                workers=QUERY_VALIDATION_WORKERS
+            )
+            split = len(inappropriate)
+            if (scores[:, :split] >= self.inappropriate_threshold).any():
+                return False, INAPPROPRIATE_MESSAGE
+            educational = educational or bool((scores[:, split:] >= self.educational_threshold).any())
+        if not educational:
+            return False, NOT_EDUCATIONAL_MESSAGE
+        return True, ""
+
+
+def load_query_validator(path: str = QUERY_KEYWORDS_FILE) -> QueryValidator:
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return QueryValidator(
+        educational=config["educational"]["keywords"],
+        inappropriate=config["inappropriate"]["keywords"],
+        educational_threshold=config["educational"].get("threshold", 70),
+        inappropriate_threshold=config["inappropriate"].get("threshold", 96)
+    )
+
+
+query_validator = load_query_validator()
+
+
+def validate_educational_query(query: str) -> tuple[bool, str]:
+    """
+    Validate if the query is education-related and appropriate for lesson planning.
+    Returns (is_valid, error_message)
+    """
+    return query_validator.validate(query)
+
+
+# (query, expected validity); checked by running this module directly.
+REGRESSION_CASES = [
+    ("Create a lesson plan with group work", True),
+    ("Add a formative assessment at the end", True),
+    ("Make a worksheet with 5 questions", True),
+    ("Give me a quizz for this lesson", True),
+    ("for math", False),
+    ("a story for my son", False),
+    ("adult for math weather religions", False),
+    ("give me financial advice on stock", False),
+    ("tell me celebrity gossip", False),
+]
+
+
+if __name__ == "__main__":
+    failures = [(q, expected) for q, expected in REGRESSION_CASES if validate_educational_query(q)[0] != expected]
+    for query, expected in failures:
+        print(f"❌ {query!r}: expected {'valid' if expected else 'rejected'}")
+    print(f"✅ {len(REGRESSION_CASES) - len(failures)}/{len(REGRESSION_CASES)} query validation cases pass")
@@ -0,0 +1,77 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from markdownrender import RENDERERS
+from tracing import span
+
+load_dotenv()
+
+RENDER_CACHE_ENTRIES = int(os.getenv("RENDER_CACHE_ENTRIES", "256"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+def _renderer_name(renderer) -> str:
+    if isinstance(renderer, str):
+        return renderer
+    return f"{renderer.__module__}.{renderer.__qualname__}"
+
+
+class RenderCache:
+    """
+    LRU of rendered text keyed by (renderer, sha256 of the input), bounded by entry count and
+    by the characters held. Renderers are pure, so one result serves the HTML view, the
+    DOCX/PDF builders and the blob log alike, across reruns and sessions.
+    """
+
+    def __init__(self, max_entries: int = RENDER_CACHE_ENTRIES, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def render(self, renderer, text: str) -> str:
+        """Run renderer (a markdownrender.RENDERERS name or a str -> str function) on text, once per content"""
+        if not text:
+            return ""
+        name = _renderer_name(renderer)
+        key = (name, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return value
+            self.counters["misses"] += 1
+
+        func = RENDERERS[renderer] if isinstance(renderer, str) else renderer
+        with span(f"render.{name.rsplit('.', 1)[-1]}", chars=len(text)):
+            value = func(text)
+        self._put(key, value)
+        return value
+
+    def _put(self, key, value: str):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self._size += len(value)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+render_cache = RenderCache()
+
+
+def render(renderer, text: str) -> str:
+    return render_cache.render(renderer, text)
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from rapidfuzz import process, fuzz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# 0 turns the near-duplicate tier off; otherwise the minimum token_set_ratio to reuse an answer.
+RESPONSE_CACHE_FUZZY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_FUZZY_THRESHOLD", "0"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def messages_key(messages: list) -> str:
+    """Hash of the chat messages with whitespace differences ignored"""
+    return _hash([[m["role"], _normalize(m["content"])] for m in messages])
+
+
+def template_key(messages: list, query: str) -> str:
+    """Hash of the messages with the user query blanked out, so near-duplicate queries share a scope"""
+    query = _normalize(query)
+    return _hash([[m["role"], _normalize(m["content"]).replace(query, "{query}")] for m in messages])
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _, _ = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._unlink(key, entry)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float, scope: str, query: str):
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._unlink(key, previous)
+            self._entries[key] = (time.time() + ttl, value, scope, query)
+            self._entries.move_to_end(key)
+            self._scopes.setdefault(scope, {})[query] = key
+            while len(self._entries) > self.max_entries:
+                self._unlink(*self._entries.popitem(last=False))
+
+    def _unlink(self, key: str, entry: tuple):
+        """Drop a removed entry from its scope, and the scope once it is empty; call with the lock held"""
+        _, _, scope, query = entry
+        queries = self._scopes.get(scope)
+        if queries is None or queries.get(query) != key:
+            return
+        del queries[query]
+        if not queries:
+            del self._scopes[scope]
+
+    def scope_queries(self, scope: str) -> dict:
+        with self._lock:
+            queries = self._scopes.get(scope, {})
+            live = {q: k for q, k in queries.items() if k in self._entries}
+            if live:
+                self._scopes[scope] = live
+            else:
+                self._scopes.pop(scope, None)
+            return dict(live)
+
+
+class SQLiteBackend:
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, scope TEXT, query TEXT, value TEXT, expires_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float, scope: str, query: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, query, value, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, query, value, now + ttl, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def scope_queries(self, scope: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query, key FROM responses WHERE scope = ? AND expires_at > ?", (scope, time.time())
+            ).fetchall()
+        return dict(rows)
+
+
+class RedisBackend:
+    """Works with Redis or any server speaking its protocol; size limits come from the server's maxmemory policy."""
+
+    def __init__(self, url: str = RESPONSE_CACHE_REDIS_URL):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str):
+        return self._redis.get(f"cpalms:response:{key}")
+
+    def set(self, key: str, value: str, ttl: float, scope: str, query: str):
+        scope_key = f"cpalms:scope:{scope}"
+        pipe = self._redis.pipeline()
+        pipe.set(f"cpalms:response:{key}", value, ex=int(ttl))
+        pipe.hset(scope_key, query, key)
+        pipe.expire(scope_key, int(ttl))
+        pipe.execute()
+
+    def scope_queries(self, scope: str) -> dict:
+        return self._redis.hgetall(f"cpalms:scope:{scope}")
+
+
+class ResponseCache:
+    """
+    Cache of model answers keyed by the normalized prompt. When a fuzzy threshold is set, a miss
+    falls back to the closest earlier query whose prompt was otherwise identical.
+    """
+
+    def __init__(self, backend, ttl: float = RESPONSE_CACHE_TTL, fuzzy_threshold: float = RESPONSE_CACHE_FUZZY_THRESHOLD):
+        self.backend = backend
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        self.counters = {"exact_hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+    def get(self, messages: list, query: str):
+        """Return (answer, tier) where tier is 'exact' or 'fuzzy', or (None, None) on a miss"""
+        try:
+            value = self.backend.get(messages_key(messages))
+            if value is not None:
+                self.counters["exact_hits"] += 1
+                return value, "exact"
+
+            if self.fuzzy_threshold:
+                candidates = self.backend.scope_queries(template_key(messages, query))
+                if candidates:
+                    match = process.extractOne(
+                        _normalize(query).lower(), list(candidates.keys()),
+                        scorer=fuzz.token_set_ratio, score_cutoff=self.fuzzy_threshold
+                    )
+                    if match:
+                        value = self.backend.get(candidates[match[0]])
+                        if value is not None:
+                            self.counters["fuzzy_hits"] += 1
+                            return value, "fuzzy"
+        except Exception as e:
+            print(f"❌ Response cache lookup failed: {e}")
+
+        self.counters["misses"] += 1
+        return None, None
+
+    def put(self, messages: list, query: str, answer: str):
+        try:
+            self.backend.set(
+                messages_key(messages), answer, self.ttl,
+                template_key(messages, query), _normalize(query).lower()
+            )
+        except Exception as e:
+            print(f"❌ Response cache write failed: {e}")
+
+
+def create_response_cache():
+    """Build the cache selected by RESPONSE_CACHE_BACKEND (memory, sqlite, redis or off)"""
+    if RESPONSE_CACHE_BACKEND == "off":
+        return None
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        backend = SQLiteBackend()
+    elif RESPONSE_CACHE_BACKEND == "redis":
+        try:
+            backend = RedisBackend()
+        except ImportError:
+            print("⚠️ RESPONSE_CACHE_BACKEND is redis but the redis package is not installed (pip install redis); using the in-memory cache.")
+            backend = MemoryBackend()
+    else:
+        backend = MemoryBackend()
+    return ResponseCache(backend)
@@ -0,0 +1,179 @@
+import os
+import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from itertools import islice
+from azure.core.exceptions import HttpResponseError
+from getdatafromblob import fetch_and_get_lesson
+from tracing import span
+
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+LESSON_FETCH_TIMEOUT = float(os.getenv("LESSON_FETCH_TIMEOUT", "15"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "20"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
+# OData predicates pushed to Azure Search; override if the index schema makes other fields filterable.
+BENCHMARK_FILTER = os.getenv("BENCHMARK_FILTER", "search.ismatch('\"{benchmark}\"', 'benchmarkId')")
+ATTACHMENT_FILTER = os.getenv("ATTACHMENT_FILTER", "search.ismatch('\"{resource_id}\"', 'metadata_storage_path')")
+
+_RESOURCE_IN_PATH = re.compile(r"/(\d{5,6})/")
+
+# Shared by every session so the number of in-flight network calls stays bounded.
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval")
+
+
+@dataclass
+class RetrievalContext:
+    """Everything fetched before the prompt is built for one request"""
+    resource_id: str
+    benchmark: str
+    lesson: object = None
+    matched_docs: list = field(default_factory=list)
+    attachments: list = field(default_factory=list)
+    chunks: list = field(default_factory=list)
+    timed_out: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def lesson_error(self) -> str:
+        if isinstance(self.lesson, str):
+            return self.lesson
+        if self.lesson is None:
+            return f"⚠️ Could not load the lesson plan for Resource ID '{self.resource_id}' in time. Please try again."
+        return ""
+
+    @property
+    def des(self):
+        return self.lesson.get("Description")
+
+    @property
+    def grade_level(self):
+        return self.lesson.get("GradeLevelNames")
+
+    @property
+    def title(self):
+        return self.lesson.get("Title")
+
+    @property
+    def attachments_hyperlinks(self) -> str:
+        return convert_attachment_paths_to_links(self.attachments)
+
+
+def convert_attachment_paths_to_links(paths):
+    seen = set()
+    unique_paths = []
+    for path in paths:
+        if path not in seen:
+            seen.add(path)
+            unique_paths.append(path)
+
+    hyperlinks = []
+    for i, url in enumerate(unique_paths, start=1):
+        filename = os.path.basename(url)
+        hyperlinks.append(f"{i}. [{filename}]({url})")
+    return "\n".join(hyperlinks)
+
+
+def _odata_literal(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def _collect(results, limit: int) -> list:
+    # Iterating the pager follows continuation tokens, so every page up to the limit is read.
+    return list(islice(results, limit))
+
+
+def search_benchmark_docs(search_client, benchmark: str, requested_sections: list) -> list:
+    if not requested_sections:
+        return []
+
+    phrases = " | ".join(f'"{section.replace("_", " ")}"' for section in requested_sections)
+    search_filter = (
+        BENCHMARK_FILTER.format(benchmark=_odata_literal(benchmark))
+        + f" and search.ismatch('{_odata_literal(phrases)}')"
+    )
+    try:
+        search_results = _collect(search_client.search(
+            search_text=benchmark,
+            filter=search_filter,
+            select=["benchmarkId", "objectives"],
+        ), SEARCH_MAX_RESULTS)
+    except HttpResponseError as e:
+        print(f"⚠️ Filtered benchmark search rejected, falling back to top=60 scan: {e.message}")
+        search_results = [
+            doc for doc in search_client.search(search_text=benchmark, top=60)
+            if any(section in str(doc).lower() for section in requested_sections)
+        ]
+
+    matched_docs = []
+    for doc in search_results:
+        if benchmark in (doc.get("benchmarkId") or ""):
+            matched_docs.append({k: v for k, v in doc.items() if k == "objectives"})
+    return matched_docs
+
+
+def search_attachment_chunks(search_client_1, resource_id: str):
+    try:
+        results = _collect(search_client_1.search(
+            search_text="*",
+            filter=ATTACHMENT_FILTER.format(resource_id=_odata_literal(resource_id)),
+            select=["chunk", "metadata_storage_path"],
+        ), SEARCH_MAX_RESULTS)
+    except HttpResponseError as e:
+        print(f"⚠️ Filtered attachment search rejected, falling back to top=60 scan: {e.message}")
+        query_for_resource = f"{resource_id} give all documents for this id"
+        results = search_client_1.search(search_text=query_for_resource, top=60)
+
+    attachments = []
+    chunks = []
+    for doc in results:
+        path = doc.get("metadata_storage_path", "")
+        match = _RESOURCE_IN_PATH.search(path)
+        if match and match.group(1) == resource_id:
+            attachments.append(path)
+            chunks.append(doc.get("chunk", ""))
+    return attachments, chunks
+
+
+def _timed(context, name, func, *args):
+    started = time.monotonic()
+    try:
+        with span(name):
+            return func(*args)
+    finally:
+        context.timings[name] = round(time.monotonic() - started, 3)
+
+
+def _submit(context, name, func, *args):
+    # Run in a copy of the caller's context so the worker's span joins the request trace.
+    return _executor.submit(contextvars.copy_context().run, _timed, context, name, func, *args)
+
+
+def _result_or_default(future, started, timeout, name, default, context):
+    try:
+        return future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+    except FutureTimeoutError:
+        future.cancel()
+        context.timed_out.append(name)
+        print(f"⚠️ {name} timed out after {timeout:.0f}s")
+    except Exception as e:
+        print(f"❌ {name} failed: {e}")
+    return default
+
+
+def retrieve_context(search_client, search_client_1, benchmark: str, resource_id: str, requested_sections: list) -> RetrievalContext:
+    """Run the lesson fetch and both searches in parallel and collect their results"""
+    context = RetrievalContext(resource_id=resource_id, benchmark=benchmark)
+    started = time.monotonic()
+
+    lesson_future = _submit(context, "lesson_fetch", fetch_and_get_lesson, benchmark, resource_id)
+    docs_future = _submit(context, "benchmark_search", search_benchmark_docs, search_client, benchmark, requested_sections)
+    chunks_future = _submit(context, "attachment_search", search_attachment_chunks, search_client_1, resource_id)
+
+    context.lesson = _result_or_default(lesson_future, started, LESSON_FETCH_TIMEOUT, "Lesson fetch", None, context)
+    context.matched_docs = _result_or_default(docs_future, started, SEARCH_TIMEOUT, "Benchmark search", [], context)
+    context.attachments, context.chunks = _result_or_default(chunks_future, started, SEARCH_TIMEOUT, "Attachment search", ([], []), context)
+    context.timings["retrieval"] = round(time.monotonic() - started, 3)
+    return context
@@ -0,0 +1,587 @@
+"""
+The lesson customization pipeline with no UI attached: retrieval, prompt, model call,
+worksheet generation, clean-up and logging. The Streamlit app (main.py) and the HTTP API
+(api.py) are both clients. Callers pass the conversation history in, so the service keeps
+no per-user state and any number of API workers can serve the same users.
+"""
+import os
+import re
+import time
+import threading
+from dataclasses import dataclass, field, asdict
+from azure.search.documents import SearchClient
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.policies import RetryPolicy
+from openai import AzureOpenAI
+from dotenv import load_dotenv
+from getdatafromblob import format_lesson_output, lesson_etag
+from rendercache import render
+from log_to_blob import log_query_to_blob
+from exports import export_service, EXPORT_FORMATS
+from artifactstore import artifact_store, artifact_link, remove_artifact_links
+from retrieval import retrieve_context
+from responsecache import create_response_cache
+from localsearch import LocalSearchIndex, ATTACHMENT_SEARCH_BACKEND, LOCAL_SEARCH_DIR
+from queryvalidation import validate_educational_query
+from benchmarks import normalize_benchmark_code
+from tracing import start_trace, span, traced, current_trace
+from contextpacking import pack_section, count_tokens, CONTEXT_DOCS_TOKEN_BUDGET, CONTEXT_CHUNKS_TOKEN_BUDGET
+
+load_dotenv()
+
+AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
+AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX")
+AZURE_SEARCH_INDEX_NAME_1 = os.getenv("AZURE_SEARCH_INDEX_1")
+AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_KEY")
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
+OPENAI_DEPLOYMENT_NAME = os.getenv("OPENAI_DEPLOYMENT_NAME")
+OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "true").lower() == "true"
+
+LOG_CONTAINER = "datastorage"
+EXPORT_TITLE = "CPALMS Lesson Plan"
+HISTORY_LIMIT = 10
+
+retry_policy = RetryPolicy(retry_total=2, timeout=120)
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class LessonRequestError(ValueError):
+    """A request the pipeline cannot serve; the message is meant for the user"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _get_shared(name: str, factory):
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def _build_search_clients():
+    search_client = SearchClient(
+        endpoint=AZURE_SEARCH_ENDPOINT,
+        index_name=AZURE_SEARCH_INDEX_NAME,
+        credential=AzureKeyCredential(AZURE_SEARCH_API_KEY),
+        retry_policy=retry_policy
+    )
+    if ATTACHMENT_SEARCH_BACKEND == "local":
+        search_client_1 = LocalSearchIndex(LOCAL_SEARCH_DIR)
+    else:
+        search_client_1 = SearchClient(
+            endpoint=AZURE_SEARCH_ENDPOINT,
+            index_name=AZURE_SEARCH_INDEX_NAME_1,
+            credential=AzureKeyCredential(AZURE_SEARCH_API_KEY),
+            retry_policy=retry_policy
+        )
+    return search_client, search_client_1
+
+
+def get_search_clients():
+    """The two search clients, built once per process; attachments may come from the local index"""
+    return _get_shared("search_clients", _build_search_clients)
+
+
+def get_openai_client():
+    """The Azure OpenAI client, built once per process"""
+    return _get_shared("openai", lambda: AzureOpenAI(
+        api_key=OPENAI_API_KEY,
+        api_version=OPENAI_API_VERSION,
+        azure_endpoint=OPENAI_API_BASE
+    ))
+
+
+def get_response_cache():
+    """Shared cache of model answers, or None when RESPONSE_CACHE_BACKEND=off"""
+    return _get_shared("response_cache", create_response_cache)
+
+
+def azure_openai_call(messages) -> str:
+    response = get_openai_client().chat.completions.create(
+        model=OPENAI_DEPLOYMENT_NAME,
+        messages=messages,
+        temperature=0.9,
+        max_tokens=16384
+    )
+    return response.choices[0].message.content
+
+
+def stream_azure_openai_call(messages):
+    """Yield the completion text piece by piece as the model generates it"""
+    stream = get_openai_client().chat.completions.create(
+        model=OPENAI_DEPLOYMENT_NAME,
+        messages=messages,
+        temperature=0.9,
+        max_tokens=16384,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def clean_ai_response(text):
+    """Clean AI response by removing separators, extra whitespace, and leading '#'"""
+    text = re.sub(r'---\s*Chunk\s*\d+\s*Response\s*---', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
+    text = text.strip()
+    lines = text.split('\n')
+    cleaned_lines = []
+    for line in lines:
+        line = re.sub(r'^#+\s*', '', line)
+        cleaned_line = line.strip()
+        if cleaned_line and not re.match(r'^[-\s]*$', cleaned_line):
+            cleaned_lines.append(line)
+   
+    return '\n'.join(cleaned_lines)
+
+
+def extract_required_section_from_query(query: str) -> list:
+    """
+    Extracts section types from a user's natural language query, such as
+    assessments, activities, stations, prior knowledge, etc.
+    """
+    keywords = {
+        "assessments": [
+            "assessment", "assessments", "assessment questions", "quiz", "quizzes",
+            "formative assessment", "summative assessment", "assessment games", "assessment rubrics"
+        ],
+        "prior_knowledge": [
+            "prior knowledge", "prior knowledge requirements", "prior knowledge checklist","plan"
+        ],
+        "stations": [
+            "station", "stations", "learning stations", "study stations", "problem-solving stations",
+            "collaborative stations", "peer review stations", "station rotations"
+        ],
+        "activities": [
+            "activity", "activities", "hands-on activities", "interactive activities",
+            "collaborative activities", "creative workshops", "movement-based learning",
+            "real-world applications", "context activities", "skill-building games", "investigations"
+        ],
+        "guiding_questions": [
+            "guiding questions", "guiding question"
+        ]
+    }
+ 
+    matched_sections = []
+    q_lower = query.lower()
+ 
+    for section, trigger_phrases in keywords.items():
+        for phrase in trigger_phrases:
+            if phrase in q_lower:
+                matched_sections.append(section)
+                break  
+ 
+    return matched_sections
+
+
+def extract_test_or_worksheet_section(text: str) -> str:
+    """
+    Extract the section of the AI output that includes a worksheet, quiz, or test.
+    Looks for headings like '## Worksheet' or '## Quiz Questions' and captures everything
+    until the next heading or end of text.
+    """
+    pattern = r"(##\s*(Worksheet|Quiz|Test)[\s\S]*?)(?=\n##|\Z)"
+    match = re.search(pattern, text, flags=re.IGNORECASE)
+    
+    if match:
+        return match.group(1).strip()
+    else:
+        question_lines = []
+        for line in text.splitlines():
+            if any(q in line.lower() for q in ["question", "?", "1.", "a)", "b)", "answer"]):
+                question_lines.append(line)
+        return "\n".join(question_lines).strip()
+    
+
+WORKSHEET_UNAVAILABLE_NOTE = "⚠️ The worksheet download could not be prepared. Please run the request again to get it."
+_GENERATE_DOCX_LINK = re.compile(r'\[(.*?)\]\(#GENERATE_DOCX_LINK\)')
+
+
+def replace_generate_docx_link(markdown_text, artifact_id):
+    return _GENERATE_DOCX_LINK.sub(lambda m: artifact_link(m.group(1), artifact_id), markdown_text)
+
+
+def remove_generate_docx_link(markdown_text):
+    """Drop the worksheet link placeholders and say once that the download is unavailable"""
+    return _GENERATE_DOCX_LINK.sub("", markdown_text).rstrip() + "\n\n" + WORKSHEET_UNAVAILABLE_NOTE
+
+
+@traced("build_prompt")
+def generate_creative_response(query, context, history=()):
+    """
+    Generate a creative, comprehensive response for the specific question asked,
+    using the lesson plan and search results gathered in the retrieval context.
+    history holds the caller's earlier entries (query, resource_id, benchmark, ai_output).
+    """
+    des = context.des
+    grade_level = context.grade_level
+    resource_id = context.resource_id
+    benchmark = context.benchmark
+    attachments_hyperlinks = context.attachments_hyperlinks
+    docs_data = pack_section("lesson docs", [str(doc) for doc in context.matched_docs], query, CONTEXT_DOCS_TOKEN_BUDGET)
+    combined_chunks = pack_section("attachments", context.chunks, query, CONTEXT_CHUNKS_TOKEN_BUDGET)
+    user_history = list(history or [])
+    
+    history_context = ""
+    previous_full_response = ""
+    is_follow_up = False
+    
+    if user_history:
+        current_session = [entry for entry in user_history 
+                          if entry['resource_id'] == resource_id and entry['benchmark'] == benchmark]
+        if current_session:
+            is_follow_up = True
+            latest_entry = current_session[-1]
+            previous_entry = latest_entry
+
+            history_context = ""
+
+            if previous_entry:
+                prev_response = previous_entry["ai_output"]
+
+                split_parts = prev_response.split("📘 **Previous Response**")
+
+                if len(split_parts) > 1:
+                    new_content_only = split_parts[0].strip()
+                    history_context += f"**Previous Response (New Content Portion Only):**\n{new_content_only}\n\n"
+                else:
+                    history_context += f"**Previous Response:**\n{prev_response.strip()}\n\n"
+
+        else:
+            history_context = "\n**Previous Session Context:**\n"
+            for i, entry in enumerate(user_history[-2:], 1):  # Include last 2 queries for context
+                history_context += f"{i}. Previous Query: {entry['query']}\n"
+                history_context += f"   Resource ID: {entry['resource_id']}, Benchmark: {entry['benchmark']}\n"
+                history_context += f"   Previous Response Summary: {entry['ai_output'][:300]}...\n\n"
+    history_context=remove_artifact_links(history_context)
+    print("=== HISTORY CONTEXT SENT TO OPENAI ===")
+    print(f"Number of history entries: {len(user_history)}")
+    print("History context being sent:")
+    print(history_context if history_context else "No history context")
+    print("=== END HISTORY CONTEXT ===")
+    
+    system_content = f"""
+You are a creative educational content generator specializing in lesson plan enhancement for CPALMS (Collaborative Planning for Learning in Mathematics and Science).
+
+**STRICT OPERATIONAL GUIDELINES:**
+- You MUST ONLY respond to queries related to education, lesson planning, teaching strategies, assessments, questions,quiz and classroom activities
+- You MUST NOT respond to queries about weather reports, sports reports, celebrities, politics, personal advice, medical/legal advice, or any non-educational topics
+- If a query is not education-related respond with: "I can only assist with educational content and lesson planning. Please ask about teaching strategies, assessments, activities,quiz or other lesson plan components."
+- ALL responses must be directly related to the provided Resource ID, Benchmark, {query},{des} and {grade_level}.
+- Stay on-topic and within educational context at all times and never attempt to interpret non-educational requests as educational.
+- Generate the data based on only the {des} and {grade_level} only.example:for "grade :K,des:students knows numbers upto 5,response:should contain numbers till 5 not beyond."
+- If user asks to create a worksheet, quiz, or test (e.g., "create 10-question test"), you MUST generate the actual content (not just suggestions), formatted with questions and answer choices where appropriate.
+- If the user requests or if the content logically involves a worksheet, quiz, or test (even implicitly), DO NOT suggest that the teacher create one. INSTEAD, generate the full worksheet/test content directly.
+- Never use or echo {attachments_hyperlinks}. Instead, insert this exact placeholder for downloads:[📄 Download Worksheet as doc](#GENERATE_DOCX_LINK).Always include it at the end or with the content.
+
+**Context:**
+- Resource ID: {resource_id}
+- Benchmark: {benchmark}
+- Available lesson plan sections: Learning Objectives, Prior Knowledge, Guiding Questions, Teaching Phase, Guided Practice, Independent Practice, Closure, Assessments, Accommodations, etc.
+- Attachments: {attachments_hyperlinks}
+- Follow-up Request: {"YES - This is a follow-up request" if is_follow_up else "NO - This is a new request"}
+
+{history_context}
+
+**Your Task:**
+Analyze the user's specific request: "{query}"
+Analyze the following lesson description, grade level and {query}, then generate creative content aligned with it:\n\ngrade Level: {grade_level}\ndescription: {des}
+
+**CRITICAL INSTRUCTIONS BASED ON REQUEST TYPE:**
+
+{"**THIS IS A FOLLOW-UP REQUEST:**" if is_follow_up else "**THIS IS A NEW REQUEST:**"}
+
+{'''
+- You MUST include the *COMPLETE* previous response in your output.
+- HOWEVER, display the NEW content FIRST, and the previous response BELOW it satisfying -**If the user's query asks to *remove* or *exclude* previous responses (e.g., "ignore previous", "remove old content", "start fresh"), then do NOT include the ## 📘 **Previous Response** or if ## 📘 **Previous Response** has multiple sections remove that mentioned section and continue.**
+- **If the user's query asks to *remove* or *exclude* previous responses (e.g., "ignore previous", "remove old content", "start fresh"), then do NOT include the ## 📘 **Previous Response** or remove that particular section in previous response and continue. Just generate new content as if this were a new request.**
+- If user specifies to "remove" specific section then remove it from previous response. 
+ - Use clear headers and spacing to visually separate them.
+- For example if previous response is there then,
+    ## ✨ **Latest Customization**
+    [new additions]
+        
+ 
+    ## 📘 **Previous Response**
+    [complete previous content]
+- This layout ensures the newest information is always shown at the top of the output it is mandatory to use the same format if previous response is present.
+- This ensures the user sees both the original content AND the new additions in one complete response
+- Maintain consistency with the previous response's style and format
+- DO NOT reuse wording or content from the attachments or provided document context unless explicitly asked to summarize it.
+- For worksheets, quizzes, or tests, you MUST generate **original content** that is not found in the attachments or lesson data.
+- Do not include file names or references from the attachments unless the user says “use that file.”
+- If asked for more of the same type (e.g., "add more stations"), continue numbering from where the previous response ended''' if is_follow_up else '''- Generate complete, comprehensive content from scratch
+- Provide thorough coverage of the requested topic
+- Create standalone content that doesn't assume previous context
+- Be comprehensive and detailed in your initial response'''}
+
+
+
+**Content Guidelines:**
+1. **Be creative and engaging** - Use varied teaching strategies, real-world connections, and student-centered approaches  
+2. **Use provided data as foundation** - Build upon existing lesson content when relevant
+3. **Format appropriately** - Use clear headings, bullet points, and structured content
+4. **Be comprehensive** - Provide detailed, actionable content (minimum 1000 words per section requested)
+5. **Include practical examples** - Give specific activities, questions, or scenarios
+6. ****Strict grade-level appropriateness** - Ensure all content is developmentally appropriate for the specified grade level. For Kindergarten, avoid complex word problems, multi-step logic, or real-world contexts that require abstract thinking. Use simple language, visual elements, and tactile-friendly examples.**
+
+
+**For specific request types:**
+- **Assessments**: Create varied question types (multiple choice, short answer, performance tasks) - **minimum 10 questions**. DO NOT reuse questions from attachments. Provide original questions. At the end, insert a link like: [📄 Download Worksheet as doc](#GENERATE_DOCX_LINK)
+- **Activities**: Design hands-on, collaborative, and differentiated activities
+- **Stations**: Create 3-5 distinct learning stations with clear objectives and descriptions  
+- **Prior Knowledge**: Identify prerequisites and diagnostic strategies (minimum 2000 words if requested)
+- **Guiding Questions**: Develop thought-provoking, inquiry-based questions
+- Do NOT use any attachments_hyperlinks. Instead, insert this link:[📄 Download Worksheet as doc](#GENERATE_DOCX_LINK)
+
+
+### 📄 Worksheet / Assessment DOC Generation Rules
+- Never say “create a worksheet” or suggest that a teacher prepares one. Always generate it directly and strictly based on {grade_level} and {des} instructions given above.
+- If needed, say exactly:
+    You can use the following worksheet with students:
+    [📄 Download Worksheet as doc](#GENERATE_DOCX_LINK)
+- Then generate the full content in the DOC. Adjust the format based on the type:
+  - **Worksheets**: Start with **Name:** ________  **Date:** ________, then 10+ grade-appropriate questions, end with an **Answer Key**
+  - **Quizzes**: Include clear questions (MCQs, short answer), instructions, and an Answer Key
+  - **Plans**: Use a structured format with headings, instructions, and space for student responses
+- Generate the DOC if:
+  1. The user requests a worksheet, quiz, or assessment “as doc”
+  2. Your response recommends using one (e.g., “students should complete a worksheet”)
+- Everything should be matched according to grade only. like if it is for Kindergarten,they cannot solve word questions.
+
+
+### Additional Enforcement Rules:
+- For Kindergarten:
+  - **Focus on visual, tactile, symbolic, or object-based interactions only — such as sorting, counting pictures, or matching icons (e.g., 🍎 + 🍌 = ?)**.
+  - You must only generate questions and content based on the provided lesson {des} and {grade_level}. Do NOT introduce standards, objectives, or math skills beyond what is described.
+  - Do NOT include word problems, narrative questions, or reading-based scenarios unless the description clearly states that students are ready for them.
+  - Do NOT include number combinations or equations involving values beyond the specified range. For example, if students are learning to count or sort objects, do not include making 10, subtraction, or addition beyond 5 unless described.
+- If a worksheet, quiz, or assessment is generated as a downloadable document, its content must NOT be repeated in the AI Customization response area. The AI customization must contain supporting or instructional content only — not the exact worksheet/quiz content — unless the user explicitly requests the questions be shown in both places.
+- If the user's query requests to “remove previous,” “exclude old content,” “start fresh,” or similar — you MUST fully omit the `## 📘 Previous Response` block and all of its contents, including any quizzes, assessments, stations, or other structured sections.
+- If the user specifies to “remove” or “replace” only a **specific section** (e.g., “remove previous quiz only” or “remove station 3”), then remove only that part from the `## 📘 Previous Response` block and regenerate it as new inside the `## ✨ Latest Customization` section. Keep the rest of the previous response unchanged.
+
+
+**Output Format:**
+Provide clean, well-organized content with clear section headers and practical details.
+Use markdown formatting for better readability.
+"""
+
+    messages = [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": f"""
+REMINDER: Only respond to educational queries related to lesson planning, teaching, assessments, or classroom activities. Refuse any non-educational requests.
+
+User Query: {query}
+
+Available Lesson Data: {docs_data}
+
+Additional Context from Attachments: {combined_chunks}
+
+{'IMPORTANT: This is a follow-up request. Your response can include the COMPLETE previous response shown in the system context above untill it is explicitly mentioned "remove" in {query}, followed by the new content. Start with the full previous content, then add a separator, then the new additions.' if is_follow_up else 'Generate creative, comprehensive content specifically for:'} {query}
+"""}
+    ]
+    return messages
+
+
+@dataclass
+class CustomizationRequest:
+    resource_id: str
+    benchmark_code: str
+    benchmark_id: str
+    query: str
+    benchmark: str = ""
+    requested_sections: list = field(default_factory=list)
+
+
+def prepare_request(resource_id: str, benchmark_code: str, benchmark_id: str, query: str) -> CustomizationRequest:
+    """Check and normalize the form fields; raises LessonRequestError with the message to show"""
+    resource_id = (resource_id or "").strip()
+    benchmark_code = (benchmark_code or "").strip()
+    benchmark_id = (benchmark_id or "").strip()
+    query = (query or "").strip()
+
+    if not all([resource_id, benchmark_code, benchmark_id, query]):
+        raise LessonRequestError("⚠️ All fields are required. Please fill out Resource ID, Benchmark Code, Benchmark ID, and Query.")
+    if not re.fullmatch(r'\d{5,6}', resource_id):
+        raise LessonRequestError("❌ Resource ID must be a 5- or 6-digit number (only digits allowed).")
+    benchmark = normalize_benchmark_code(benchmark_code)
+    if not benchmark:
+        raise LessonRequestError("❌ Please enter a valid benchmark.")
+    is_valid_query, error_message = validate_educational_query(query)
+    if not is_valid_query:
+        raise LessonRequestError(error_message)
+
+    return CustomizationRequest(
+        resource_id=resource_id,
+        benchmark_code=benchmark_code,
+        benchmark_id=benchmark_id,
+        query=query,
+        benchmark=benchmark,
+        requested_sections=extract_required_section_from_query(query),
+    )
+
+
+@dataclass
+class CustomizationResult:
+    resource_id: str
+    benchmark: str
+    query: str
+    lesson_plan: str
+    ai_output: str
+    attachments: list = field(default_factory=list)
+    worksheet_id: str = None
+    cache: str = "miss"
+    timings: dict = field(default_factory=dict)
+    trace_id: str = ""
+    trace: list = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _customize(request: CustomizationRequest, history, stream: bool, dedup_key: str):
+    started = time.time()
+    search_client, search_client_1 = get_search_clients()
+    response_cache = get_response_cache()
+    resource_id = request.resource_id
+    benchmark = request.benchmark
+
+    context = retrieve_context(search_client, search_client_1, benchmark, resource_id, request.requested_sections)
+    if context.lesson_error:
+        raise LessonRequestError(context.lesson_error, status=404)
+    grade_level = context.grade_level
+    title = context.title
+    attachments_hyperlinks = context.attachments_hyperlinks
+
+    q1=request.query+" targeted at Grade: "+grade_level
+    q2=q1+" having title:"+title
+    messages = generate_creative_response(query=q2, context=context, history=history)
+    system_tokens = count_tokens(messages[0]["content"])
+    user_tokens = count_tokens(messages[1]["content"])
+    print(f"📏 Prompt: system {system_tokens} tokens, user {user_tokens} tokens")
+
+    with span("format_lesson"):
+        formatted_lesson = format_lesson_output(context.lesson, attachments_hyperlinks, etag=lesson_etag(benchmark, resource_id))
+    yield {
+        "event": "context",
+        "lesson_plan": formatted_lesson,
+        "attachments_hyperlinks": attachments_hyperlinks,
+        "attachment_count": len(context.chunks),
+    }
+
+    model_started = time.time()
+    with span("response_cache.get"):
+        lesson_output, cache_tier = response_cache.get(messages, q2) if response_cache else (None, None)
+    if lesson_output is not None:
+        print(f"✅ AI response served from cache ({cache_tier} match)")
+    else:
+        with span("openai", streaming=stream, prompt_tokens=system_tokens + user_tokens):
+            if stream:
+                parts = []
+                for piece in stream_azure_openai_call(messages):
+                    parts.append(piece)
+                    yield {"event": "delta", "text": piece}
+                lesson_output = "".join(parts)
+            else:
+                lesson_output = azure_openai_call(messages)
+        if response_cache:
+            response_cache.put(messages, q2, lesson_output)
+    model_time = time.time() - model_started
+
+    worksheet_id = None
+    if "#GENERATE_DOCX_LINK" in lesson_output:
+        worksheet_section = extract_test_or_worksheet_section(lesson_output)
+        worksheet_clean = render("docx_markdown", worksheet_section)
+        try:
+            worksheet_id = artifact_store.put(
+                export_service.build("docx", worksheet_clean, "Student Worksheet"),
+                mime=EXPORT_FORMATS["docx"]["mime"],
+                filename=f"student_worksheet_{resource_id}.docx"
+            )
+        except Exception as e:
+            # The answer is already paid for; return it without the download rather than fail.
+            print(f"❌ Worksheet export failed: {e}")
+        if worksheet_id:
+            lesson_output = replace_generate_docx_link(lesson_output, worksheet_id)
+        else:
+            lesson_output = remove_generate_docx_link(lesson_output)
+    lesson_output = clean_ai_response(lesson_output)
+
+    timings = dict(context.timings, model=round(model_time, 3))
+    with span("log_query"):
+        log_query_to_blob(
+            container_name=LOG_CONTAINER,
+            resource_id=resource_id,
+            benchmark_code=request.benchmark_code,
+            benchmark_id=request.benchmark_id,
+            query=request.query,
+            processing_time=time.time() - started,
+            lesson_plan=formatted_lesson,
+            ai_output=lesson_output,
+            dedup_key=dedup_key,
+            metrics={
+                "timings": timings,
+                "timed_out": context.timed_out,
+                "tokens": {"system": system_tokens, "user": user_tokens},
+                "cache": cache_tier or "miss",
+                "attachments": len(context.chunks),
+                "streaming": stream and cache_tier is None,
+                "trace_id": current_trace().trace_id,
+                "trace": current_trace().to_dicts(finished_only=True)
+            }
+        )
+
+    return CustomizationResult(
+        resource_id=resource_id,
+        benchmark=benchmark,
+        query=request.query,
+        lesson_plan=formatted_lesson,
+        ai_output=lesson_output,
+        attachments=list(dict.fromkeys(context.attachments)),
+        worksheet_id=worksheet_id,
+        cache=cache_tier or "miss",
+        timings=timings,
+    )
+
+
+def customize_events(request: CustomizationRequest, history=(), stream: bool = OPENAI_STREAMING, dedup_key: str = None):
+    """
+    Run one customization and yield its progress as dicts: a "context" event once the lesson
+    and attachments are in, "delta" events with model text while streaming, and a final
+    "result" event carrying CustomizationResult.to_dict(). Raises LessonRequestError when
+    the lesson cannot be loaded. Consume it on one thread; the trace lives in its context.
+    """
+    history = list(history or [])[-HISTORY_LIMIT:]
+    with start_trace("customization", resource_id=request.resource_id, benchmark=request.benchmark) as trace:
+        result = yield from _customize(request, history, stream, dedup_key)
+    result.trace_id = trace.trace_id
+    result.trace = trace.to_dicts()
+    yield {"event": "result", **result.to_dict()}
+
+
+def customize_lesson(request: CustomizationRequest, history=(), dedup_key: str = None) -> CustomizationResult:
+    """The whole customization in one call, without streaming"""
+    for event in customize_events(request, history, stream=False, dedup_key=dedup_key):
+        if event["event"] == "result":
+            return CustomizationResult(**{k: v for k, v in event.items() if k != "event"})
+
+
+def combined_export_text(lesson_plan: str, ai_output: str, fmt: str) -> str:
+    """Lesson plan and AI customization as one document body for the DOCX or PDF builder"""
+    renderer = "docx_markdown" if fmt == "docx" else "clean_text"
+    formatted_lesson = render(renderer, lesson_plan)
+    formatted_ai = render(renderer, render(remove_artifact_links, ai_output))
+    return f"""📘 Lesson Plan Output:\n\n{formatted_lesson}\n\n✨ AI Customization Output:\n\n{formatted_ai}"""
+
+
+def export_customization(lesson_plan: str, ai_output: str, fmt: str) -> bytes:
+    """The combined lesson as DOCX or PDF bytes; may raise ExportQueueFull"""
+    return export_service.build(fmt, combined_export_text(lesson_plan, ai_output, fmt), EXPORT_TITLE)
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Append one OTLP/JSON document per finished trace to this file.
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")
+# OTLP/HTTP JSON endpoint of a local collector, e.g. http://localhost:4318/v1/traces
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "cpalms-customizer")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: str, attributes: dict):
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self, origin: float) -> dict:
+        span = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset": round(self.start - origin, 4),
+            "duration": round(self.duration, 4),
+        }
+        if self.attributes:
+            span["attributes"] = self.attributes
+        if self.error:
+            span["error"] = self.error
+        return span
+
+
+class Trace:
+    """Spans recorded for one request, from any thread that carries the request's context"""
+
+    def __init__(self, name: str, attributes: dict):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, None, attributes)
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dicts(self, finished_only: bool = False) -> list:
+        with self._lock:
+            spans = [s for s in self.spans if s.end is not None or not finished_only]
+        return [s.to_dict(self.root.start) for s in sorted(spans, key=lambda s: s.start)]
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Begin a trace for one request; spans opened inside it, on this thread or propagated ones, join it"""
+    trace = Trace(name, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = type(e).__name__
+        raise
+    finally:
+        trace.root.end = time.time()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        export_trace(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; does nothing outside a trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    trace.add(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.time()
+        _current_span.reset(token)
+
+
+def traced(name: str = None):
+    """Decorator form of span()"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    """The trace as an OTLP/JSON ExportTraceServiceRequest"""
+    with trace._lock:
+        spans = list(trace.spans)
+    otlp_spans = []
+    for s in spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(s.start * 1e9)),
+            "endTimeUnixNano": str(int((s.end or trace.root.end or time.time()) * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in (s.attributes or {}).items()],
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        if s.error:
+            otlp_span["status"] = {"code": 2, "message": s.error}
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "cpalms.tracing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+def _export(trace: Trace):
+    payload = to_otlp(trace)
+    if TRACE_EXPORT_FILE:
+        try:
+            with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload) + "\n")
+        except OSError as e:
+            print(f"❌ Failed to write trace file: {e}")
+    if TRACE_OTLP_ENDPOINT:
+        try:
+            import requests
+            requests.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=5).raise_for_status()
+        except Exception as e:
+            print(f"❌ Failed to send trace to collector: {e}")
+
+
+def export_trace(trace: Trace):
+    if TRACE_EXPORT_FILE or TRACE_OTLP_ENDPOINT:
+        _export_executor.submit(_export, trace)
+
+
+def waterfall_html(spans: list) -> str:
+    """Indented timeline bars for spans as returned by Trace.to_dicts()"""
+    if not spans:
+        return ""
+    total = max(s["offset"] + s["duration"] for s in spans) or 1.0
+    depth = {}
+    rows = []
+    for s in spans:
+        level = depth.get(s["parent_id"], -1) + 1
+        depth[s["span_id"]] = level
+        left = 100 * s["offset"] / total
+        width = max(100 * s["duration"] / total, 0.5)
+        color = "#e74c3c" if s.get("error") else "#667eea"
+        rows.append(
+            f'<div style="display:flex;align-items:center;font-size:12px;margin:2px 0;">'
+            f'<div style="width:240px;padding-left:{level * 12}px;white-space:nowrap;overflow:hidden;">{s["name"]}</div>'
+            f'<div style="flex:1;position:relative;height:14px;background:#f4f4f4;">'
+            f'<div style="position:absolute;left:{left:.2f}%;width:{width:.2f}%;height:14px;background:{color};"></div></div>'
+            f'<div style="width:80px;text-align:right;">{s["duration"] * 1000:.0f} ms</div></div>'
+        )
+    return "".join(rows)